@@ -1,19 +1,32 @@
 import os
-import json
+import gzip
+import hashlib
+import orjson
 import shutil
 import subprocess
 import tempfile
+import time
+import uuid
+from functools import lru_cache, partial
+from itertools import chain
 import boto3
+from boto3.s3.transfer import TransferConfig
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from flask import Flask, request, redirect, render_template, url_for, flash, jsonify
-from models import db, Song
+from flask import Flask, Request, request, redirect, render_template, url_for, flash, jsonify
+from flask.json.provider import DefaultJSONProvider
+from models import db, Song, create_missing_columns, create_missing_indexes, create_search_index, song_fts, normalize_text
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import sqlite3
 from markupsafe import Markup
 import re
-from sqlalchemy import case
+from sqlalchemy import case, event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import load_only
 from pathlib import Path
 from generate_tex import generate_latex_content
 from stamper import stamp_pdf
@@ -39,22 +52,117 @@ session = boto3.session.Session(
     region_name=AWS_REGION
 )
 
+# Files uploaded in parallel, and multipart threads per file
+S3_UPLOAD_WORKERS = 6
+S3_TRANSFER_CONCURRENCY = 10
+
 s3 = session.client(
     "s3",
     config=boto3.session.Config(
         s3={'addressing_style': 'virtual'},
-        signature_version='s3v4'
+        signature_version='s3v4',
+        # One connection per concurrent part upload, instead of botocore's default 10
+        max_pool_connections=S3_UPLOAD_WORKERS * S3_TRANSFER_CONCURRENCY
     )
 )
 
+# Multipart, multi-threaded transfers for large uploads (built once, shared by all uploads)
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=S3_TRANSFER_CONCURRENCY,
+    use_threads=True
+)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify/request.json through orjson: compact output, no key sorting"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+
+# Uploads larger than this are spooled to named files next to the upload folder
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+UPLOAD_TMP_FOLDER = BASE_DIR + '/.upload_tmp'
+
+def _current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# Mode file.save() would give a new file; spool files are created 0600 and links share their mode
+UPLOAD_FILE_MODE = 0o666 & ~_current_umask()
+
+class UploadRequest(Request):
+    """Spool large uploads to named temp files so save_upload() can hard-link them into place"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is None or total_content_length > UPLOAD_SPOOL_SIZE:
+            return tempfile.NamedTemporaryFile('wb+', dir=UPLOAD_TMP_FOLDER)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///songs.db'
+# Keep SQLite connections open across requests instead of reopening the file (and WAL index) each time
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'poolclass': QueuePool,
+    'pool_size': 5,
+    'max_overflow': 10,
+    'connect_args': {'check_same_thread': False, 'timeout': 30},
+}
 app.config['UPLOAD_FOLDER'] = f'{BASE_DIR}/static/uploads'
 app.secret_key = 'your-secret-key-here'
-ALLOWED_EXTENSIONS = {'mp3', 'pdf', 'midi', 'mid', 'tex', 'mscz'}
+ALLOWED_EXTENSIONS = frozenset({'mp3', 'pdf', 'midi', 'mid', 'tex', 'mscz'})
 JSON_FOLDER = 'songs'
 BACKUP_FOLDER = BASE_DIR + '/instance/backups'
+LATEX_BUILD_FOLDER = BASE_DIR + '/instance/latex_build'
+CATEGORIES = [
+    "stále omšové spevy", "úvod", "medzispevy (žalmy; aleluja)", "obetovanie",
+    "prijímanie", "poďakovanie po prijímaní", "záver", "adorácia", "advent",
+    "vianoce", "pôst", "veľká noc", "cez rok", "k Duchu Svätému", "mariánske",
+    "k svätcom", "detské", "iné", "liturgia hodín", "sobášne", "Taizé",
+    "krížová cesta", "nevhodné"
+]
+
+# (name, lowercase name, ILIKE pattern) per category, built once at import
+CATEGORY_ILIKE_PATTERNS = tuple((category, category.lower(), f'%{category.lower()}%') for category in CATEGORIES)
+CATEGORY_PATTERN_BY_NAME = {lower: pattern for _, lower, pattern in CATEGORY_ILIKE_PATTERNS}
+
+def category_pattern(category_lower):
+    """ILIKE pattern for a lowercased category name (unknown names are built on the fly)"""
+    return CATEGORY_PATTERN_BY_NAME.get(category_lower) or f'%{category_lower}%'
+
+# Chord markers like [C] or [Am7] inside lyrics
+CHORD_MARKUP_RE = re.compile(r"\[([^\]]+)\]")
+SHOWCHORDS_RE = re.compile(r'\\setboolean\{showchords\}\{.*?\}')
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling and a larger page cache for every SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
 
 db.init_app(app)
 
@@ -62,21 +170,126 @@ db.init_app(app)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(BACKUP_FOLDER, exist_ok=True)
 os.makedirs(JSON_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+
+def prepare_latex_build_folder():
+    """Symlink the fonts into the persistent LaTeX build folder once, instead of copying them for every run"""
+    fonts_src = os.path.join(BASE_DIR, 'static/fonts')
+    fonts_dest = os.path.join(LATEX_BUILD_FOLDER, 'fonts')
+    os.makedirs(fonts_dest, exist_ok=True)
+    for font_file in os.listdir(fonts_src):
+        link = os.path.join(fonts_dest, font_file)
+        if font_file.endswith(('.ttf', '.otf')) and not os.path.lexists(link):
+            os.symlink(os.path.join(fonts_src, font_file), link)
+
+prepare_latex_build_folder()
 
 # Helper functions
+# Re-uploads of the same file names skip werkzeug's scrubbing
+safe_filename = lru_cache(maxsize=512)(secure_filename)
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    dot = filename.rfind('.')
+    return dot != -1 and filename[dot + 1:].lower() in ALLOWED_EXTENSIONS
 
 def upload_to_s3(file, folder='mp3s'):
+    """Upload a file object to S3 and return its key (raises on failure)"""
+    filename = safe_filename(file.filename)
+    key = f"{folder}/{filename}"
+    s3.upload_fileobj(file, S3_BUCKET, key, ExtraArgs={'ContentType': file.content_type}, Config=S3_TRANSFER_CONFIG)
+    return key
+
+def load_paths(raw):
+    """Decode a JSON list of file paths stored in a Song column (malformed values count as empty)"""
+    if not raw:
+        return []
     try:
-        filename = secure_filename(file.filename)
-        key = f"{folder}/{filename}"
-        s3.upload_fileobj(file, S3_BUCKET, key, ExtraArgs={'ContentType': file.content_type})
-        return key
-    except Exception as e:
-        flash(f"S3 upload error: {e}")
+        return orjson.loads(raw)
+    except (orjson.JSONDecodeError, TypeError):
+        return []
 
-        return None
+@lru_cache(maxsize=2048)
+def load_paths_readonly(raw):
+    """Cached load_paths for serializing song lists. Returns a tuple so the shared
+    value can't be mutated; keyed by the raw column value, so edits need no invalidation"""
+    return tuple(load_paths(raw))
+
+def save_upload(file, path):
+    """Save an uploaded file; uploads spooled to a named temp file are hard-linked instead of copied"""
+    spool_path = getattr(file.stream, 'name', None)
+    if isinstance(spool_path, str) and os.path.dirname(spool_path) == UPLOAD_TMP_FOLDER:
+        file.stream.flush()
+        try:
+            os.link(spool_path, path)
+            os.chmod(path, UPLOAD_FILE_MODE)
+            return
+        except OSError:
+            pass  # Existing target or another filesystem: fall back to copying
+    file.save(path)
+
+def dump_paths(paths):
+    """Encode a list of file paths for storage in a Song column (orjson emits UTF-8 directly)"""
+    return orjson.dumps(paths).decode()
+
+@lru_cache(maxsize=1024)
+def normalize_search_query(query):
+    """Normalize a search query the same way Song.search_text is normalized (chords are stripped too)"""
+    return normalize_text(query)
+
+def count_categories(query_obj):
+    """Count songs per category for the given query in a single aggregate SELECT"""
+    row = query_obj.with_entities(*[
+        func.sum(case((Song.categories.ilike(pattern), 1), else_=0))
+        for _, _, pattern in CATEGORY_ILIKE_PATTERNS
+    ]).one()
+    return {category: count or 0 for category, count in zip(CATEGORIES, row)}
+
+# Columns needed by the song list views and endpoints (skips song_parts / search_text);
+# loaded with raiseload=True so any other column access fails instead of lazy-loading per row
+SONG_LIST_COLUMNS = (
+    Song.id, Song.song_id, Song.title, Song.author, Song.version_name,
+    Song.title_original, Song.author_original, Song.admin_checked, Song.printed,
+    Song.categories, Song.alternative_titles, Song.mp3_paths, Song.sheet_pdf_paths,
+    Song.pdf_lyrics_path, Song.pdf_chords_path, Song.tex_path
+)
+
+# Category counts over the whole database, cached until a song write is committed
+_category_counts_cache = None
+# Bumped on every invalidation, so counts computed from an older snapshot are never cached
+_category_counts_generation = 0
+
+def get_category_counts_cached():
+    global _category_counts_cache
+    counts = _category_counts_cache
+    if counts is None:
+        generation = _category_counts_generation
+        counts = count_categories(Song.query)
+        if generation == _category_counts_generation:
+            _category_counts_cache = counts
+    return counts
+
+def invalidate_category_counts():
+    """Drop cached category counts after songs were inserted, updated or deleted"""
+    global _category_counts_cache, _category_counts_generation
+    _category_counts_generation += 1
+    _category_counts_cache = None
+
+def mark_category_counts_stale(session, flush_context):
+    """Remember that this session wrote songs; the cache is dropped once that is committed,
+    since a flush alone is not visible to other connections yet"""
+    if any(isinstance(obj, Song) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['songs_written'] = True
+
+def invalidate_category_counts_on_commit(session):
+    if session.info.pop('songs_written', False):
+        invalidate_category_counts()
+
+def forget_song_writes(session):
+    session.info.pop('songs_written', None)
+
+event.listen(db.session, 'after_flush', mark_category_counts_stale)
+event.listen(db.session, 'after_commit', invalidate_category_counts_on_commit)
+event.listen(db.session, 'after_rollback', forget_song_writes)
 
 def stamp_uploaded_pdf(pdf_path, song_id, version_name=None):
     """
@@ -93,97 +306,132 @@ def stamp_uploaded_pdf(pdf_path, song_id, version_name=None):
                - path: Path to the stamped PDF if successful, original path if failed
                - error_message: Error message if stamping failed, empty string if successful
     """
-    print(f"[DEBUG] stamp_uploaded_pdf called with:")
-    print(f"  pdf_path: {pdf_path}")
-    print(f"  song_id: {song_id}")
-    print(f"  version_name: {version_name}")
+    app.logger.debug(f"stamp_uploaded_pdf called with pdf_path={pdf_path}, song_id={song_id}, version_name={version_name}")
 
     try:
         if not pdf_path:
             error_msg = "No PDF path provided"
-            print(f"[DEBUG] {error_msg}")
+            app.logger.warning(error_msg)
             return False, pdf_path, error_msg
 
         if not os.path.exists(pdf_path):
             error_msg = f"PDF file does not exist: {pdf_path}"
-            print(f"[DEBUG] {error_msg}")
+            app.logger.warning(error_msg)
             return False, pdf_path, error_msg
 
-        print(f"[DEBUG] PDF file exists, proceeding with stamping")
+        app.logger.debug("PDF file exists, proceeding with stamping")
 
         # Create stamped filename
         base_dir = os.path.dirname(pdf_path)
         base_name = os.path.splitext(os.path.basename(pdf_path))[0]
         stamped_path = os.path.join(base_dir, f"{base_name}_stamped.pdf")
 
-        print(f"[DEBUG] Stamped path will be: {stamped_path}")
+        app.logger.debug(f"Stamped path will be: {stamped_path}")
 
 
         # Check if required dependencies are available
         try:
-            from PyPDF2 import PdfReader, PdfWriter
+            from pypdf import PdfReader, PdfWriter
             from reportlab.pdfgen import canvas
         except ImportError as ie:
             error_msg = f"Required PDF libraries not installed: {str(ie)}"
-            print(f"[DEBUG] {error_msg}")
+            app.logger.error(error_msg)
             return False, pdf_path, error_msg
 
         # Stamp the PDF
-        print(f"[DEBUG] Calling stamp_pdf function...")
+        app.logger.debug("Calling stamp_pdf function...")
         stamp_result = stamp_pdf(pdf_path, stamped_path, song_id, version_name)
-        print(f"[DEBUG] stamp_pdf returned: {stamp_result}")
+        app.logger.debug(f"stamp_pdf returned: {stamp_result}")
 
         if stamp_result:
-            print(f"[DEBUG] Stamping successful, replacing original file")
+            app.logger.debug("Stamping successful, replacing original file")
             # Check if stamped file was created
             if os.path.exists(stamped_path):
-                print(f"[DEBUG] Stamped file exists, replacing original")
-                os.remove(pdf_path)
-                os.rename(stamped_path, pdf_path)
-                print(f"[DEBUG] File replacement completed")
+                app.logger.debug("Stamped file exists, replacing original")
+                os.replace(stamped_path, pdf_path)
+                app.logger.debug("File replacement completed")
                 return True, pdf_path, ""
             else:
                 error_msg = f"Stamped file was not created at {stamped_path}"
-                print(f"[DEBUG] ERROR: {error_msg}")
+                app.logger.error(error_msg)
                 return False, pdf_path, error_msg
         else:
             error_msg = "PDF stamping function returned False - check stamper.py logs for details"
-            print(f"[DEBUG] {error_msg}")
+            app.logger.error(error_msg)
             return False, pdf_path, error_msg
 
     except Exception as e:
         error_msg = f"Exception during PDF stamping: {str(e)}"
-        print(f"[DEBUG] {error_msg}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception(error_msg)
         return False, pdf_path, error_msg
 
-# Routes
-
+# Background jobs run in a small in-process pool; finished ones are polled via /api/jobs/<id>
+job_executor = ThreadPoolExecutor(max_workers=2)
+jobs = OrderedDict()
+MAX_TRACKED_JOBS = 500
+
+def log_failed_job(job_id, fn_name, future):
+    """Done-callback: a job's exception would otherwise only sit in its future"""
+    error = future.exception()
+    if error is not None:
+        app.logger.error(f"Background job {fn_name} ({job_id}) failed: {error}", exc_info=error)
+
+def submit_job(fn, *args, **kwargs):
+    """Run fn in the background and return a job id for status polling"""
+    job_id = uuid.uuid4().hex
+    future = job_executor.submit(fn, *args, **kwargs)
+    future.add_done_callback(partial(log_failed_job, job_id, fn.__name__))
+    jobs[job_id] = future
+    while len(jobs) > MAX_TRACKED_JOBS:
+        jobs.popitem(last=False)
+    return job_id
 
 # Routes
 
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a background job: running, finished (with result) or failed (with error)"""
+    future = jobs.get(job_id)
+    if future is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not future.done():
+        return jsonify({'id': job_id, 'status': 'running'})
+    error = future.exception()
+    if error:
+        return jsonify({'id': job_id, 'status': 'failed', 'error': str(error)})
+    return jsonify({'id': job_id, 'status': 'finished', 'result': future.result()})
+
 @app.route('/song/<int:song_id>/stamp_pdf', methods=['POST'])
 def stamp_existing_pdf(song_id):
     """
-    Manually stamp an existing PDF file for a song
+    Manually stamp the existing PDF files of a song. JSON clients get background job ids
+    to poll at /api/jobs/<id>; the HTML form waits so each result can be flashed.
     """
     song = Song.query.get_or_404(song_id)
-    pdf_paths = json.loads(song.sheet_pdf_paths or '[]')  # For sheet_pdfs
+    pdf_paths = load_paths(song.sheet_pdf_paths)  # For sheet_pdfs
+    run_in_background = request.accept_mimetypes.best == 'application/json'
 
+    job_ids = []
     try:
         for path in pdf_paths:
-
-
             if path and os.path.exists(path):
-                stamp_uploaded_pdf(path, song.song_id, song.version_name)
-                flash(f"PDF stamped successfully!")
+                if run_in_background:
+                    job_ids.append(submit_job(stamp_uploaded_pdf, path, song.song_id, song.version_name))
+                    continue
+                success, _, error_msg = stamp_uploaded_pdf(path, song.song_id, song.version_name)
+                if success:
+                    flash("PDF stamped successfully!")
+                else:
+                    flash(f"Error stamping PDF: {error_msg}", "error")
             else:
                 flash("PDF file not found!")
 
     except Exception as e:
         flash(f"Error stamping PDF: {str(e)}")
 
+    if run_in_background:
+        return jsonify({'job_ids': job_ids})
+
     return redirect(url_for('song_detail', song_id=song.id))
 
 
@@ -230,34 +478,46 @@ def download_stamped_sheet(song_id, sheet_filename):
         flash("Sheet PDF not found!", "error")
         return redirect(url_for('song_detail', song_id=song.id))
     
+    # The stamp only depends on the source PDF and the song's id/version, so a repeat
+    # download with a matching ETag can be answered with 304 before stamping
+    source_mtime = os.path.getmtime(current_file_path)
+    etag = hashlib.sha1(f"{song.song_id}|{song.version_name}|{source_mtime}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = 3600
+        return response
+    
     try:
-        # Create stamped version in memory using temporary file
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_stamped:
-            font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
-            success = stamp_pdf(current_file_path, temp_stamped.name, song.song_id, song.version_name, font_path)
-            
-            if not success:
-                flash("Failed to create stamped version", "error")
-                return redirect(url_for('song_detail', song_id=song.id))
-            
-            # Read the stamped PDF into memory
-            with open(temp_stamped.name, 'rb') as f:
-                pdf_data = f.read()
-            
-            # Clean up temp file
-            os.unlink(temp_stamped.name)
-            
-            # Create filename for download
-            base_name = os.path.splitext(sheet_filename)[0]
-            stamped_filename = f"{base_name}_stamped.pdf"
-            
-            # Serve from memory
-            return send_file(
-                io.BytesIO(pdf_data),
-                as_attachment=True,
-                download_name=stamped_filename,
-                mimetype='application/pdf'
-            )
+        # Stamp straight into memory
+        font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
+        pdf_buffer = io.BytesIO()
+        success = stamp_pdf(current_file_path, pdf_buffer, song.song_id, song.version_name, font_path)
+        
+        if not success:
+            flash("Failed to create stamped version", "error")
+            return redirect(url_for('song_detail', song_id=song.id))
+        pdf_buffer.seek(0)
+        
+        # Create filename for download
+        base_name = os.path.splitext(sheet_filename)[0]
+        stamped_filename = f"{base_name}_stamped.pdf"
+        
+        # Serve from memory
+        response = send_file(
+            pdf_buffer,
+            as_attachment=True,
+            download_name=stamped_filename,
+            mimetype='application/pdf',
+            # No Last-Modified: the source mtime doesn't cover song_id/version_name changes,
+            # so If-Modified-Since could revalidate a stale stamp; only the ETag is used
+            etag=etag,
+            max_age=3600
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
         
     except Exception as e:
         flash(f"Error creating stamped version: {str(e)}", "error")
@@ -282,38 +542,60 @@ def download_blank_stamped(song_id):
             flash("Blank PDF template not found!", "error")
             return redirect(url_for('song_detail', song_id=song.id))
         
-        # Create stamped blank version in memory using temporary file
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_stamped:
-            font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
-            success = stamp_pdf(blank_pdf_path, temp_stamped.name, song.song_id, song.version_name, font_path)
-            
-            if not success:
-                flash("Failed to create blank stamped version", "error")
-                return redirect(url_for('song_detail', song_id=song.id))
-            
-            # Read the stamped PDF into memory
-            with open(temp_stamped.name, 'rb') as f:
-                pdf_data = f.read()
-            
-            # Clean up temp file
-            os.unlink(temp_stamped.name)
-            
-            # Create filename for download
-            blank_filename = f"{song.song_id}_blank_stamped.pdf"
-            
-            # Serve from memory
-            return send_file(
-                io.BytesIO(pdf_data),
-                as_attachment=True,
-                download_name=blank_filename,
-                mimetype='application/pdf'
-            )
+        # Stamp straight into memory
+        font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
+        pdf_buffer = io.BytesIO()
+        success = stamp_pdf(blank_pdf_path, pdf_buffer, song.song_id, song.version_name, font_path)
+        
+        if not success:
+            flash("Failed to create blank stamped version", "error")
+            return redirect(url_for('song_detail', song_id=song.id))
+        pdf_buffer.seek(0)
+        
+        # Create filename for download
+        blank_filename = f"{song.song_id}_blank_stamped.pdf"
+        
+        # Serve from memory
+        return send_file(
+            pdf_buffer,
+            as_attachment=True,
+            download_name=blank_filename,
+            mimetype='application/pdf'
+        )
         
     except Exception as e:
         flash(f"Error creating blank stamped version: {str(e)}", "error")
         return redirect(url_for('song_detail', song_id=song.id))
 
 
+# Presigned URLs are reused for this many seconds before being signed again
+PRESIGNED_URL_WINDOW = 600
+# SigV4 presigned URLs are valid for at most 7 days
+PRESIGNED_URL_MAX_EXPIRES = 7 * 24 * 3600
+
+def sign_presigned_url(key, expires_in):
+    """Sign a GET URL for an S3 key"""
+    return s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': S3_BUCKET, 'Key': key},
+        ExpiresIn=expires_in
+    )
+
+@lru_cache(maxsize=4096)
+def cached_presigned_url(key, expires_in, window):
+    """
+    Sign a GET URL valid for expires_in + PRESIGNED_URL_WINDOW seconds. `window` is only
+    part of the cache key, so the same key rendered again within one PRESIGNED_URL_WINDOW
+    reuses the signed URL and it still has at least expires_in seconds left.
+    """
+    return sign_presigned_url(key, expires_in + PRESIGNED_URL_WINDOW)
+
+def presigned_url(key, expires_in=3600):
+    # Short-lived URLs would be stretched too much by the extra window: sign those fresh
+    if expires_in < PRESIGNED_URL_WINDOW or expires_in + PRESIGNED_URL_WINDOW > PRESIGNED_URL_MAX_EXPIRES:
+        return sign_presigned_url(key, expires_in)
+    return cached_presigned_url(key, expires_in, int(time.time()) // PRESIGNED_URL_WINDOW)
+
 @app.template_filter('presigned_url')
 def presigned_url_filter(key, expires_in=3600):
     """
@@ -322,15 +604,11 @@ def presigned_url_filter(key, expires_in=3600):
     """
 
     try:
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': key},
-            ExpiresIn=expires_in
-        )
+        url = presigned_url(key, expires_in)
         return Markup(url)
     except Exception as e:
         # Optional: return empty string or a placeholder URL if key not found
-        print(f"Error generating presigned URL for {key}: {e}")
+        app.logger.warning(f"Error generating presigned URL for {key}: {e}")
         return ""
 
 @app.route('/api/presigned_url')
@@ -343,11 +621,7 @@ def get_presigned_url():
         
         expires_in = int(request.args.get('expires_in', 3600))
         
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': key},
-            ExpiresIn=expires_in
-        )
+        url = presigned_url(key, expires_in)
         
         return redirect(url)
         
@@ -359,23 +633,112 @@ def delete_from_s3(s3_key):
         s3.delete_object(Bucket=S3_BUCKET, Key=s3_key)
         return True
     except Exception as e:
-        flash(f"S3 delete error: {e}, {AWS_SECRET_ACCESS_KEY}")
+        flash(f"S3 delete error: {e}")
         return False
 
+def delete_many_from_s3(s3_keys):
+    """Delete several S3 objects using batched DeleteObjects requests (max 1000 keys each)"""
+    for start in range(0, len(s3_keys), 1000):
+        batch = s3_keys[start:start + 1000]
+        app.logger.debug(f"Deleting {len(batch)} S3 files: {batch}")
+        response = s3.delete_objects(
+            Bucket=S3_BUCKET,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        for error in response.get('Errors', []):
+            app.logger.error(f"S3 delete error for {error.get('Key')}: {error.get('Message')}")
+
 def update_multi_files_s3(current_paths, new_files, folder='mp3s'):
-    paths = json.loads(current_paths or '[]')
+    paths = load_paths(current_paths)
+    files = [file for file in new_files if file and allowed_file(file.filename)]
+
+    def upload(file):
+        try:
+            return upload_to_s3(file, folder=folder), None
+        except Exception as e:
+            return None, e
+
+    # Upload new files to S3, several at a time so the connection isn't idle between files
+    if len(files) > 1:
+        with ThreadPoolExecutor(max_workers=min(S3_UPLOAD_WORKERS, len(files))) as executor:
+            results = list(executor.map(upload, files))
+    else:
+        results = [upload(file) for file in files]
 
-    # Upload new files to S3
-    for file in new_files:
-        if file and allowed_file(file.filename):
-            key = upload_to_s3(file, folder=folder)
-            if key:
+    # flash() needs the request context, so errors are reported from this thread
+    for file, (key, error) in zip(files, results):
+        if key:
+            # The same file may already be listed, e.g. attached by a partly failed direct upload
+            if key not in paths:
                 paths.append(key)
-            else:
-                flash(f"S3 upload error: {file}")
+        else:
+            flash(f"S3 upload error for {file}: {error}")
+
+    return dump_paths(paths)
+
+
+# Files the browser may upload straight to S3: kind -> (key folder, Song attribute, content type, extensions)
+DIRECT_UPLOAD_KINDS = {
+    'mp3': ('mp3s', 'mp3_paths', 'audio/mpeg', ('mp3',)),
+    'midi': ('midis', 'midi_paths', 'audio/midi', ('mid', 'midi')),
+}
+DIRECT_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+@app.route('/api/presigned_upload', methods=['POST'])
+def presigned_upload():
+    """Return a presigned POST so the browser can upload an MP3/MIDI file directly to S3"""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    filename = data.get('filename') or ''
+
+    if kind not in DIRECT_UPLOAD_KINDS or not allowed_file(filename):
+        return jsonify({'error': 'Unsupported file type'}), 400
+
+    folder, _, content_type, extensions = DIRECT_UPLOAD_KINDS[kind]
+    if filename.rsplit('.', 1)[1].lower() not in extensions:
+        return jsonify({'error': 'Unsupported file type'}), 400
+
+    song = Song.query.get_or_404(data.get('song_id'))
+    key = f"{folder}/{song.id}/{safe_filename(filename)}"
+
+    try:
+        post = s3.generate_presigned_post(
+            S3_BUCKET,
+            key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 0, DIRECT_UPLOAD_MAX_SIZE]
+            ],
+            ExpiresIn=600
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({'url': post['url'], 'fields': post['fields'], 'key': key})
+
+@app.route('/api/song/<int:song_id>/files', methods=['PATCH'])
+def attach_uploaded_file(song_id):
+    """Record an S3 key uploaded directly by the browser in the song's file list"""
+    song = Song.query.get_or_404(song_id)
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    key = data.get('key') or ''
+
+    if kind not in DIRECT_UPLOAD_KINDS:
+        return jsonify({'error': 'Unsupported file type'}), 400
 
+    folder, attr, _, _ = DIRECT_UPLOAD_KINDS[kind]
+    if not key.startswith(f"{folder}/{song.id}/"):
+        return jsonify({'error': 'Invalid key'}), 400
 
-    return json.dumps(paths, ensure_ascii=False)
+    paths = load_paths(getattr(song, attr))
+    if key not in paths:
+        paths.append(key)
+        setattr(song, attr, dump_paths(paths))
+        db.session.commit()
+
+    return jsonify({'paths': paths})
 
 
 def get_song_upload_folder(song_id):
@@ -385,17 +748,37 @@ def get_song_upload_folder(song_id):
     return song_folder
 
 def backup_db(src_path, backup_folder):
-    """Create database backup"""
+    """Create a compacted, gzipped database backup"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = os.path.join(backup_folder, f'backup_{timestamp}.db')
 
+    # VACUUM INTO writes a compacted copy in one statement; WAL readers are not blocked
     src = sqlite3.connect(src_path)
-    dest = sqlite3.connect(backup_path)
-    with dest:
-        src.backup(dest)
-    dest.close()
-    src.close()
-    return backup_path
+    try:
+        src.execute("VACUUM INTO ?", (backup_path,))
+    finally:
+        src.close()
+
+    with open(backup_path, 'rb') as raw, gzip.open(backup_path + '.gz', 'wb', compresslevel=3) as compressed:
+        shutil.copyfileobj(raw, compressed, 1 << 20)
+    os.unlink(backup_path)
+    return backup_path + '.gz'
+
+def remove_song_folder(song_folder):
+    """Remove a song folder, unlinking its files concurrently (nested folders use rmtree)"""
+    files, subfolders = [], []
+    with os.scandir(song_folder) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            else:
+                files.append(entry.path)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(os.unlink, files))
+    for subfolder in subfolders:
+        shutil.rmtree(subfolder)
+    os.rmdir(song_folder)
 
 def delete_song_files(song_id):
     """Delete all files associated with a song - both local and S3 files"""
@@ -403,34 +786,18 @@ def delete_song_files(song_id):
     song = Song.query.get(song_id)
     
     if song:
-        # Delete S3 files (MP3s and MIDIs)
+        # Delete S3 files (MP3s and MIDIs) in as few DeleteObjects requests as possible
         try:
-            # Delete MP3 files from S3
-            if song.mp3_paths:
-                mp3_paths = json.loads(song.mp3_paths)
-                for s3_key in mp3_paths:
-                    if s3_key:  # Make sure the key is not empty
-                        print(f"Deleting S3 MP3 file: {s3_key}")
-                        delete_from_s3(s3_key)
-            
-            # Delete MIDI files from S3
-            if song.midi_paths:
-                midi_paths = json.loads(song.midi_paths)
-                for s3_key in midi_paths:
-                    if s3_key:  # Make sure the key is not empty
-                        print(f"Deleting S3 MIDI file: {s3_key}")
-                        delete_from_s3(s3_key)
-                        
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"Error parsing S3 file paths for song {song_id}: {e}")
+            s3_keys = load_paths(song.mp3_paths) + load_paths(song.midi_paths)
+            delete_many_from_s3([s3_key for s3_key in s3_keys if s3_key])
         except Exception as e:
-            print(f"Error deleting S3 files for song {song_id}: {e}")
+            app.logger.error(f"Error deleting S3 files for song {song_id}: {e}")
     
     # Delete local files (sheet PDFs, MuseScore files, TeX, generated PDFs, etc.)
     song_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(song_id))
     if os.path.exists(song_folder):
-        print(f"Deleting local song folder: {song_folder}")
-        shutil.rmtree(song_folder)
+        app.logger.debug(f"Deleting local song folder: {song_folder}")
+        remove_song_folder(song_folder)
 
 # Routes
 
@@ -465,42 +832,23 @@ def generate_tex(song_id):
 def index():
     # Load only first batch of songs for initial page load
     initial_batch_size = 50
-    songs_query = Song.query.order_by(Song.song_id).limit(initial_batch_size).all()
-    total_songs = Song.query.count()
-    
-    # Calculate full database statistics
-    total_admin_checked = Song.query.filter(Song.admin_checked == True).count()
-    total_printed = Song.query.filter(Song.printed == True).count()
+    songs_query = Song.query.options(load_only(*SONG_LIST_COLUMNS, raiseload=True)).order_by(Song.song_id).limit(initial_batch_size).all()
     
-    # Calculate category counts for the entire database
-    categories = [
-        "stále omšové spevy", "úvod", "medzispevy (žalmy; aleluja)", "obetovanie",
-        "prijímanie", "poďakovanie po prijímaní", "záver", "adorácia", "advent",
-        "vianoce", "pôst", "veľká noc", "cez rok", "k Duchu Svätému", "mariánske",
-        "k svätcom", "detské", "iné", "liturgia hodín", "sobášne", "Taizé",
-        "krížová cesta", "nevhodné"
-    ]
+    # Calculate full database statistics in one pass
+    total_songs, total_admin_checked, total_printed = db.session.query(
+        func.count(Song.id),
+        func.coalesce(func.sum(case((Song.admin_checked == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Song.printed == True, 1), else_=0)), 0)
+    ).one()
     
-    category_counts = {}
-    all_songs = Song.query.all()  # For category counting - could be optimized with raw SQL
-    for category in categories:
-        count = 0
-        for song in all_songs:
-            if song.categories and category.lower() in song.categories.lower():
-                count += 1
-        category_counts[category] = count
+    # Category counts for the entire database (single aggregate query, cached)
+    category_counts = get_category_counts_cached()
     
     # Convert Song objects to JSON-serializable dictionaries
     songs_data = []
     for song in songs_query:
-        # Parse file paths safely
-        mp3_paths = []
-        sheet_pdf_paths = []
-        try:
-            mp3_paths = json.loads(song.mp3_paths or '[]')
-            sheet_pdf_paths = json.loads(song.sheet_pdf_paths or '[]')
-        except (json.JSONDecodeError, TypeError):
-            pass
+        mp3_paths = load_paths_readonly(song.mp3_paths)
+        sheet_pdf_paths = load_paths_readonly(song.sheet_pdf_paths)
         
         songs_data.append({
             'id': song.id,
@@ -536,19 +884,13 @@ def get_songs_paginated():
         offset = int(request.args.get('offset', 0))
         limit = min(int(request.args.get('limit', 25)), 100)  # Max 100 songs per batch
         
-        songs = Song.query.order_by(Song.song_id).offset(offset).limit(limit).all()
+        songs = Song.query.options(load_only(*SONG_LIST_COLUMNS, raiseload=True)).order_by(Song.song_id).offset(offset).limit(limit).all()
         total_songs = Song.query.count()
         
         songs_data = []
         for song in songs:
-            # Parse file paths safely
-            mp3_paths = []
-            sheet_pdf_paths = []
-            try:
-                mp3_paths = json.loads(song.mp3_paths or '[]')
-                sheet_pdf_paths = json.loads(song.sheet_pdf_paths or '[]')
-            except (json.JSONDecodeError, TypeError):
-                pass
+            mp3_paths = load_paths_readonly(song.mp3_paths)
+            sheet_pdf_paths = load_paths_readonly(song.sheet_pdf_paths)
             
             songs_data.append({
                 'id': song.id,
@@ -593,8 +935,17 @@ def songs_view(song_ids):
         flash("No song IDs provided", "error")
         return redirect(url_for('index'))
     
-    # Query songs based on the provided IDs
-    songs = Song.query.filter(Song.song_id.in_(song_id_list)).all()
+    # Query songs based on the provided IDs. IN uses one expanding bind parameter, so the
+    # statement compiles once and stays in SQLAlchemy's cache; URL order is applied here
+    # instead of with a CASE whose shape changes with every ID list
+    songs = (
+        Song.query
+        .filter(Song.song_id.in_(song_id_list))
+        .options(load_only(*SONG_LIST_COLUMNS, raiseload=True))
+        .all()
+    )
+    url_position = {sid: i for i, sid in enumerate(song_id_list)}
+    songs.sort(key=lambda song: (url_position[song.song_id], song.id))
     
     # Check for missing songs
     found_ids = [song.song_id for song in songs]
@@ -607,29 +958,40 @@ def songs_view(song_ids):
         flash("No songs found with the provided IDs", "error")
         return redirect(url_for('index'))
     
-    # Sort songs to match the order from the URL
-    songs_dict = {song.song_id: song for song in songs}
-    ordered_songs = [songs_dict[sid] for sid in song_id_list if sid in songs_dict]
-    
-    return render_template('songs_view.html', songs=ordered_songs, song_ids=song_ids)
+    return render_template('songs_view.html', songs=songs, song_ids=song_ids)
+
+def read_song_json(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
 
 @app.route('/load_songs')
 def load_songs():
-    for fname in os.listdir(JSON_FOLDER):
-        if fname.endswith(".json"):
-            with open(os.path.join(JSON_FOLDER, fname), 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if not Song.query.filter_by(title=data['title']).first():
-                    song = Song(
-                        title=data.get('title'),
-                        author=data.get('author') if data.get('author') is not None and len(data.get('author')) > 1 else None,
-                        categories=",".join(data.get('categories', [])),
-                        song_parts=json.dumps(data["song_parts"], ensure_ascii=False),
-                        # checked=False,
-                        admin_checked=False
-                    )
-                    db.session.add(song)
+    json_files = [os.path.join(JSON_FOLDER, fname) for fname in os.listdir(JSON_FOLDER) if fname.endswith(".json")]
+
+    # Read all JSON files concurrently; database work stays on this thread
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        songs_data = list(executor.map(read_song_json, json_files))
+
+    # One query for all existing titles instead of one lookup per file
+    existing_titles = {title for (title,) in db.session.query(Song.title)}
+
+    rows = []
+    for data in songs_data:
+        if data['title'] in existing_titles:
+            continue
+        existing_titles.add(data['title'])
+        rows.append(dict(
+            title=data.get('title'),
+            author=data.get('author') if data.get('author') is not None and len(data.get('author')) > 1 else None,
+            categories=",".join(data.get('categories', [])),
+            song_parts=orjson.dumps(data["song_parts"]).decode(),
+            # checked=False,
+            admin_checked=False
+        ))
+    # Batched INSERTs; song_id / search_text are computed up front instead of per-row listeners
+    Song.bulk_create(db.session, rows)
     db.session.commit()
+    invalidate_category_counts()
     flash("Songs loaded.")
     return redirect(url_for('index'))
 
@@ -641,41 +1003,41 @@ def backup():
 
 @app.route('/delete_file/<int:song_id>/<file_type>', methods=['POST'])
 def delete_file(song_id, file_type):
-    print(f"DEBUG: delete_file called with song_id={song_id}, file_type='{file_type}'", flush=True)
+    app.logger.debug(f"delete_file called with song_id={song_id}, file_type='{file_type}'")
     song = Song.query.get_or_404(song_id)
 
     if file_type == 'tex':
-        print(f"DEBUG: Deleting TeX file. song.tex_path = {song.tex_path}", flush=True)
+        app.logger.debug(f"Deleting TeX file. song.tex_path = {song.tex_path}")
         if song.tex_path:
             # Convert relative path to absolute path
             actual_path = os.path.join(BASE_DIR, song.tex_path)
             
-            print(f"DEBUG: Checking if file exists: {os.path.exists(actual_path)}", flush=True)
+            app.logger.debug(f"Checking if file exists: {os.path.exists(actual_path)}")
             if os.path.exists(actual_path):
-                print(f"DEBUG: Removing TeX file: {actual_path}", flush=True)
+                app.logger.debug(f"Removing TeX file: {actual_path}")
                 os.remove(actual_path)
                 song.tex_path = None
-                print("DEBUG: TeX file removed and path cleared", flush=True)
+                app.logger.debug("TeX file removed and path cleared")
 
                 # Also remove generated PDFs when TeX is deleted
                 if song.pdf_lyrics_path:
                     pdf_path = os.path.join(BASE_DIR, song.pdf_lyrics_path)
                     if os.path.exists(pdf_path):
-                        print(f"DEBUG: Removing lyrics PDF: {pdf_path}", flush=True)
+                        app.logger.debug(f"Removing lyrics PDF: {pdf_path}")
                         os.remove(pdf_path)
                     song.pdf_lyrics_path = None
 
                 if song.pdf_chords_path:
                     pdf_path = os.path.join(BASE_DIR, song.pdf_chords_path)
                     if os.path.exists(pdf_path):
-                        print(f"DEBUG: Removing chords PDF: {pdf_path}", flush=True)
+                        app.logger.debug(f"Removing chords PDF: {pdf_path}")
                         os.remove(pdf_path)
                     song.pdf_chords_path = None
             else:
-                print(f"DEBUG: TeX file not found at path: {actual_path}", flush=True)
+                app.logger.debug(f"TeX file not found at path: {actual_path}")
                 flash(f"TeX file not found", "error")
         else:
-            print("DEBUG: No TeX path set for this song", flush=True)
+            app.logger.debug("No TeX path set for this song")
             flash("No TeX file to delete", "error")
 
     elif file_type == 'pdf_lyrics':
@@ -703,7 +1065,7 @@ def delete_file(song_id, file_type):
         }
 
         attr = attr_mapping[file_type]
-        paths = json.loads(getattr(song, attr) or '[]')
+        paths = load_paths(getattr(song, attr))
 
         if path_to_delete in paths:
             if file_type in ['mp3', 'midi'] and delete_from_s3(path_to_delete):
@@ -714,7 +1076,7 @@ def delete_file(song_id, file_type):
             else:
                 flash(f"{file_type.upper()} file couldnt be deleted.")
 
-            setattr(song, attr, json.dumps(paths, ensure_ascii=False))
+            setattr(song, attr, dump_paths(paths))
 
     db.session.commit()
     flash(f"{file_type.upper()} file deleted.")
@@ -766,7 +1128,7 @@ def song_detail(song_id):
                 idx += 1
             else:
                 break
-        song.song_parts = json.dumps(parts, ensure_ascii=False)
+        song.song_parts = orjson.dumps(parts).decode()
 
         # For new songs, add to session first to get an ID
         if is_new_song:
@@ -782,9 +1144,9 @@ def song_detail(song_id):
                 if not is_new_song and current_path and os.path.exists(current_path):
                     os.remove(current_path)
                 # Save new file
-                filename = secure_filename(file.filename)
+                filename = safe_filename(file.filename)
                 path = os.path.join(song_folder, filename)
-                file.save(path)
+                save_upload(file, path)
                 return path
             return current_path
 
@@ -795,21 +1157,22 @@ def song_detail(song_id):
 
         # Handle multiple files (works for both new and existing songs)
         def update_multi_files(current_paths, new_files, field_name):
-            paths = json.loads(current_paths or '[]')
+            paths = load_paths(current_paths)
+            exists, join = os.path.exists, os.path.join
 
             # Handle deletions (only for existing songs)
             if not is_new_song:
-                paths = [p for p in paths if os.path.exists(p)]  # Remove any deleted files
+                paths = [p for p in paths if exists(p)]  # Remove any deleted files
 
             # Add new files
+            append = paths.append
             for file in new_files:
                 if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    path = os.path.join(song_folder, filename)
-                    file.save(path)
-                    paths.append(path)
+                    path = join(song_folder, safe_filename(file.filename))
+                    save_upload(file, path)
+                    append(path)
 
-            return json.dumps(paths, ensure_ascii=False)
+            return dump_paths(paths)
 
         song.mp3_paths = update_multi_files_s3(song.mp3_paths, request.files.getlist('mp3s'), folder=f'mp3s/{song.id}')
         song.midi_paths = update_multi_files_s3(song.midi_paths, request.files.getlist('midis'), folder=f'midis/{song.id}')
@@ -818,7 +1181,8 @@ def song_detail(song_id):
 
         if 'associated_song_id' in request.form:
             associated_song_id = request.form['associated_song_id']
-            associated_song = Song.query.filter_by(song_id=associated_song_id).first()
+            # song_id is shared by all versions of a song, so take the first; it is served by the (song_id, version_name) index
+            associated_song = Song.query.options(load_only(Song.id, Song.song_id, Song.title)).filter(Song.song_id == associated_song_id).first()
 
             if associated_song:
                 try:
@@ -829,14 +1193,11 @@ def song_detail(song_id):
                     new_title = request.form['title']
 
                     # Update BOTH songs
-                    song.title = associated_original_title                   # Set common title
-                    song.version_name = song.version_name  # Preserve original as version
+                    song.title = associated_original_title                   # Set common title (version_name is kept)
 
                     # associated_song.title = new_title           # Set common title
                     # associated_song.version_name = associated_original_title  # Preserve original
-                    print(song.song_id)
                     song.song_id = associated_song.song_id  # Associate IDs
-                    print(song.song_id)
                     db.session.commit()
                     flash(f"Songs successfully associated with common title: {new_title}", 'success')
                     return redirect(url_for('song_view', song_id=song.id))
@@ -862,11 +1223,11 @@ def song_detail(song_id):
 
     # Prepare data for template
     song.alternative_titles = song.alternative_titles.split(';;') if song.alternative_titles else []
-    data = json.loads(song.song_parts) if song.song_parts else []
-    mp3s = json.loads(song.mp3_paths or '[]')
-    midis = json.loads(song.midi_paths or '[]')
-    sheet_pdfs = json.loads(song.sheet_pdf_paths or '[]')
-    sheet_mscz = json.loads(song.sheet_mscz_paths or '[]')
+    data = orjson.loads(song.song_parts) if song.song_parts else []
+    mp3s = load_paths(song.mp3_paths)
+    midis = load_paths(song.midi_paths)
+    sheet_pdfs = load_paths(song.sheet_pdf_paths)
+    sheet_mscz = load_paths(song.sheet_mscz_paths)
 
     return render_template('song_detail.html', 
                          song=song, 
@@ -884,15 +1245,15 @@ def song_view(song_id):
     
     # Parse song parts data
     try:
-        data = json.loads(song.song_parts or '[]')
-    except (json.JSONDecodeError, TypeError):
+        data = orjson.loads(song.song_parts or '[]')
+    except (orjson.JSONDecodeError, TypeError):
         data = []
     
     # Get file paths
-    mp3s = json.loads(song.mp3_paths or '[]')
-    midis = json.loads(song.midi_paths or '[]')
-    sheet_pdfs = json.loads(song.sheet_pdf_paths or '[]')
-    sheet_mscz = json.loads(song.sheet_mscz_paths or '[]')
+    mp3s = load_paths(song.mp3_paths)
+    midis = load_paths(song.midi_paths)
+    sheet_pdfs = load_paths(song.sheet_pdf_paths)
+    sheet_mscz = load_paths(song.sheet_mscz_paths)
 
     return render_template('song_view.html', song=song, data=data, mp3s=mp3s, midis=midis, sheet_pdfs=sheet_pdfs, sheet_mscz=sheet_mscz)
 
@@ -915,7 +1276,7 @@ def delete_song(song_id):
 # Template filter for chord rendering
 @app.template_filter('replace_chords')
 def replace_chords_filter(text):
-    return Markup(re.sub(r"\[([^\]]+)\]", r"<sup style='color:orange; font-size:1.1em'><strong>\1</strong></sup>", text))
+    return Markup(CHORD_MARKUP_RE.sub(r"<sup style='color:orange; font-size:1.1em'><strong>\1</strong></sup>", text))
 
 # Template filter for JSON parsing
 @app.template_filter('parse_json')
@@ -923,8 +1284,8 @@ def parse_json_filter(text):
     if not text:
         return []
     try:
-        return json.loads(text)
-    except (json.JSONDecodeError, TypeError):
+        return orjson.loads(text)
+    except (orjson.JSONDecodeError, TypeError):
         return []
 
 @app.route('/api/check-delete-password', methods=['POST'])
@@ -946,25 +1307,14 @@ def check_delete_password():
 def get_songs():
     prefix = request.args.get('prefix', '').upper()
     exclude_id = request.args.get('exclude_id')  # song_id to exclude
-    print(exclude_id)
-    # Base query parts
-    matching = (
-        db.session.query(Song.song_id, Song.title)
-        .filter(Song.song_id.startswith(prefix))
-    )
-
-    others = (
-        db.session.query(Song.song_id, Song.title)
-        .filter(~Song.song_id.startswith(prefix))
-    )
+    # One query: prefix matches first, then everything else (distinct, like the old UNION).
+    # No limit - the association modal filters the full list client-side.
+    songs_query = db.session.query(Song.song_id, Song.title).distinct()
 
     if exclude_id:
-        matching = matching.filter(Song.song_id != exclude_id)
-        others = others.filter(Song.song_id != exclude_id)
+        songs_query = songs_query.filter(Song.song_id != exclude_id)
 
-    combined_query = matching.union(others)
-
-    combined = combined_query.order_by(
+    combined = songs_query.order_by(
         case(
             (Song.song_id.startswith(prefix), 0),
             else_=1
@@ -978,9 +1328,6 @@ def get_songs():
 @app.route('/api/search')
 def search_songs():
     """Fast server-side search endpoint with pagination"""
-    from unidecode import unidecode
-    import re
-    
     # Get search parameters
     query = request.args.get('q', '').strip()
     printed_filter = request.args.get('printed')  # 'true' or None
@@ -994,14 +1341,10 @@ def search_songs():
     
     # Apply text search if provided
     if query:
-        # Normalize the search query the same way we normalize stored text
-        # First remove any chord brackets from the query (in case user searches for "[C] hello")
-        query_no_chords = re.sub(r'\[[^\]]*\]', '', query)
-        normalized_query = unidecode(query_no_chords.lower()).replace(",", " ").replace(".", " ").replace("-", " ").replace("_", " ").replace(";", " ").strip()
-        normalized_query = re.sub(r'\s+', ' ', normalized_query)
+        normalized_query = normalize_search_query(query)
         
-        # Use LIKE for fast substring search on pre-normalized text
-        query_obj = query_obj.filter(Song.search_text.like(f'%{normalized_query}%'))
+        # Substring search on pre-normalized text, answered by the FTS5 trigram index
+        query_obj = query_obj.filter(Song.id.in_(select(song_fts.c.rowid).where(song_fts.c.search_text.like(f'%{normalized_query}%'))))
     
     # Apply filters
     if printed_filter == 'true':
@@ -1017,55 +1360,19 @@ def search_songs():
     if categories_filter:
         category_list = [cat.strip().lower() for cat in categories_filter.split(',') if cat.strip()]
         for category in category_list:
-            query_obj = query_obj.filter(Song.categories.ilike(f'%{category}%'))
+            query_obj = query_obj.filter(Song.categories.ilike(category_pattern(category)))
     
     # Get total count before applying pagination
     total_count = query_obj.count()
     
     # Apply pagination and execute query
-    songs = query_obj.order_by(Song.song_id).offset(offset).limit(limit).all()
+    songs = query_obj.options(load_only(*SONG_LIST_COLUMNS, Song.verse1_preview, Song.chorus_preview, raiseload=True)).order_by(Song.song_id).offset(offset).limit(limit).all()
     
     # Return JSON response with song data and pagination info
     results = []
     for song in songs:
-        # Extract first 5 words from verse1 and chorus
-        verse1_preview = ""
-        chorus_preview = ""
-        
-        if song.song_parts:
-            try:
-                song_data = json.loads(song.song_parts)
-                for part in song_data:
-                    if isinstance(part, dict):
-                        part_type = part.get('type', '').lower()
-                        lines = part.get('lines', [])
-                        
-                        if part_type in ['sloka', 'verse', 'verse1', 'verš'] and not verse1_preview and lines:
-                            # Get first line and extract first 9 words
-                            first_line = lines[0] if lines else ""
-                            # Remove chord brackets [C], [Am], etc.
-                            clean_line = re.sub(r'\[[^\]]*\]', '', first_line)
-                            words = clean_line.split()[:9]
-                            verse1_preview = ' '.join(words)
-                        
-                        elif part_type in ['refren', 'chorus', 'refrén'] and not chorus_preview and lines:
-                            # Get first line and extract first 9 words
-                            first_line = lines[0] if lines else ""
-                            # Remove chord brackets [C], [Am], etc.
-                            clean_line = re.sub(r'\[[^\]]*\]', '', first_line)
-                            words = clean_line.split()[:9]
-                            chorus_preview = ' '.join(words)
-            except (json.JSONDecodeError, TypeError):
-                pass
-        
-        # Parse file paths safely
-        mp3_paths = []
-        sheet_pdf_paths = []
-        try:
-            mp3_paths = json.loads(song.mp3_paths or '[]')
-            sheet_pdf_paths = json.loads(song.sheet_pdf_paths or '[]')
-        except (json.JSONDecodeError, TypeError):
-            pass
+        mp3_paths = load_paths_readonly(song.mp3_paths)
+        sheet_pdf_paths = load_paths_readonly(song.sheet_pdf_paths)
         
         results.append({
             'id': song.id,
@@ -1079,8 +1386,8 @@ def search_songs():
             'printed': song.printed,
             'categories': song.categories or '',
             'alternative_titles': song.alternative_titles or '',
-            'verse1_preview': verse1_preview,
-            'chorus_preview': chorus_preview,
+            'verse1_preview': song.verse1_preview or '',
+            'chorus_preview': song.chorus_preview or '',
             'mp3_paths': mp3_paths,
             'sheet_pdf_paths': sheet_pdf_paths,
             'pdf_lyrics_path': song.pdf_lyrics_path,
@@ -1104,8 +1411,98 @@ def search_songs():
     })
 
 
+def run_latex(tex_path, outputs):
+    """
+    Compile tex_path with lualatex (two passes) once per (set_chords_bool, output_filename)
+    in outputs. The variants are written side by side and compiled in parallel.
+    """
+    with open(tex_path, 'r', encoding='utf-8') as f:
+        tex_content = f.read()
+
+    # Fonts are symlinked once into the shared build folder
+    fonts_dest = os.path.join(LATEX_BUILD_FOLDER, 'fonts')
+    tex_content = tex_content.replace(
+        'Path=./fonts/',
+        f'Path={fonts_dest}/'
+    )
+    # Split once around \setboolean{showchords}{...}; each variant just joins the pieces
+    tex_pieces = SHOWCHORDS_RE.split(tex_content)
+
+    required_fonts = ['Poppins-Regular.ttf', 'Poppins-Bold.ttf', 'Poppins-Italic.ttf']
+    for font in required_fonts:
+        if not os.path.exists(os.path.join(fonts_dest, font)):
+            raise RuntimeError(f"Missing font file: {font}")
+
+    tmpdir = tempfile.mkdtemp(dir=LATEX_BUILD_FOLDER)
+    processes = []
+    try:
+        os.symlink(os.path.join(BASE_DIR, "preamble.tex"), os.path.join(tmpdir, "preamble.tex"))
+
+        # One .tex per variant; the job name keeps their aux/log/pdf files apart
+        jobnames = []
+        for index, (set_chords_bool, _) in enumerate(outputs):
+            replacement = r'\setboolean{showchords}{' + ('True' if set_chords_bool else 'False') + '}'
+            jobname = f"song{index}"
+            with open(os.path.join(tmpdir, f"{jobname}.tex"), "w", encoding='utf-8') as f:
+                f.write(replacement.join(tex_pieces))
+            jobnames.append(jobname)
+
+        for _ in range(2):
+            # Appended one by one so a failing Popen still leaves the started ones to clean up
+            processes = []
+            for jobname in jobnames:
+                processes.append(subprocess.Popen(
+                    ["lualatex", "-interaction=nonstopmode", f"{jobname}.tex"],
+                    cwd=tmpdir,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True  # This means output is already strings
+                ))
+            results = []
+            for process in processes:
+                stdout, stderr = process.communicate()
+                if process.returncode != 0:
+                    # The finally block stops the other variant instead of waiting for it
+                    raise RuntimeError(f"LaTeX compilation failed {stdout} {stderr}")
+                results.append((stdout, stderr))
+        for stdout, stderr in results:
+            app.logger.debug("LaTeX output:\n%s\nLaTeX errors:\n%s", stdout, stderr)
+
+        # Move results to final paths
+        for jobname, (_, output_filename) in zip(jobnames, outputs):
+            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+            shutil.move(os.path.join(tmpdir, f"{jobname}.pdf"), output_filename)
+    finally:
+        # Never remove the build folder from under a lualatex that is still running
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def build_song_pdfs(song_id, tex_file, song_folder):
+    """Background job: compile the lyrics and chords PDFs and store their paths on the song"""
+    pdf_lyrics_path = os.path.join(song_folder, 'lyrics.pdf')
+    pdf_chords_path = os.path.join(song_folder, 'lyrics_chords.pdf')
+
+    run_latex(tex_file, [(False, pdf_lyrics_path), (True, pdf_chords_path)])
+
+    # Update DB (convert to relative paths for cross-environment compatibility)
+    paths = {
+        'pdf_lyrics_path': os.path.relpath(pdf_lyrics_path, BASE_DIR),
+        'pdf_chords_path': os.path.relpath(pdf_chords_path, BASE_DIR)
+    }
+    with app.app_context():
+        song = db.session.get(Song, song_id)
+        song.pdf_lyrics_path = paths['pdf_lyrics_path']
+        song.pdf_chords_path = paths['pdf_chords_path']
+        db.session.commit()
+    return paths
+
 @app.route('/generate_pdfs/<int:song_id>')
 def generate_pdfs(song_id):
+    """Compile the song's PDFs. JSON clients get a background job id to poll at /api/jobs/<id>;
+    the HTML buttons wait for the result so success or failure can be flashed"""
     song = Song.query.get_or_404(song_id)
 
     if not song.tex_path:
@@ -1119,81 +1516,17 @@ def generate_pdfs(song_id):
         return redirect(url_for('song_view', song_id=song_id))
 
     song_folder = get_song_upload_folder(song.id)
-    tex_file = tex_file_absolute
-    basename = os.path.splitext(os.path.basename(tex_file))[0]
 
-    pdf_lyrics_path = os.path.join(song_folder, 'lyrics.pdf')
-    pdf_chords_path = os.path.join(song_folder, 'lyrics_chords.pdf')
-
-    def run_latex(tex_path, set_chords_bool, output_filename):
-        with open(tex_path, 'r', encoding='utf-8') as f:
-            tex_content = f.read()
-
-        # Replace \setboolean{showchords}
-        replacement = r'\\setboolean{showchords}{' + ('True' if set_chords_bool else 'False') + '}'
-        tex_content = re.sub(r'\\setboolean\{showchords\}\{.*?\}', replacement, tex_content)
-
-        # Create absolute path to fonts
-        fonts_src = os.path.join(BASE_DIR, 'static/fonts')
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Copy preamble
-            shutil.copy(os.path.join(BASE_DIR, "preamble.tex"), tmpdir)
-
-            # Create fonts directory structure in temp dir
-            fonts_dest = os.path.join(tmpdir, 'fonts')
-            os.makedirs(fonts_dest, exist_ok=True)
-
-            # Copy all font files
-            for font_file in os.listdir(fonts_src):
-                if font_file.endswith(('.ttf', '.otf')):
-                    shutil.copy(os.path.join(fonts_src, font_file), fonts_dest)
-
-            # Update font path in tex content to use absolute path
-            tex_content = tex_content.replace(
-                'Path=./fonts/',
-                f'Path={fonts_dest}/'
-            )
-
-            tmp_tex_path = os.path.join(tmpdir, "song.tex")
-            # flash(f"Fonts directory contents: { os.listdir(fonts_dest)}")
-            # flash(f"Modified tex_content snippet: {tex_content[:500]}")
-            with open(tmp_tex_path, "w", encoding='utf-8') as f:
-                f.write(tex_content)
-
-            try:
-                required_fonts = ['Poppins-Regular.ttf', 'Poppins-Bold.ttf', 'Poppins-Italic.ttf']
-                for font in required_fonts:
-                    if not os.path.exists(os.path.join(fonts_dest, font)):
-                        raise RuntimeError(f"Missing font file: {font}")
-                for _ in range(2):
-                    result = subprocess.run(
-                        ["lualatex", "-interaction=nonstopmode", "song.tex"],
-                        cwd=tmpdir,
-                        check=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True  # This means output is already strings
-                    )
-                print("LaTeX Output:\n", result.stdout)  # No .decode() needed
-                print("LaTeX Errors:\n", result.stderr)   # No .decode() needed
-            except subprocess.CalledProcessError as e:
-                flash(f"STDOUT: {str(e.stdout)}")  # Remove .decode()
-                flash(f"STDERR:\n { str(e.stderr)}")  # Remove .decode()
-                raise RuntimeError(f"LaTeX compilation failed {e.stdout} {e.stderr}")
-
-            # Copy result to final path
-            generated_pdf = os.path.join(tmpdir, "song.pdf")
-            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
-            shutil.copyfile(generated_pdf, output_filename)
+    if request.accept_mimetypes.best == 'application/json':
+        job_id = submit_job(build_song_pdfs, song.id, tex_file_absolute, song_folder)
+        return jsonify({'job_id': job_id})
 
-    run_latex(tex_file, set_chords_bool=False, output_filename=pdf_lyrics_path)
-    run_latex(tex_file, set_chords_bool=True, output_filename=pdf_chords_path)
-
-    # Update DB (convert to relative paths for cross-environment compatibility)
-    song.pdf_lyrics_path = os.path.relpath(pdf_lyrics_path, BASE_DIR)
-    song.pdf_chords_path = os.path.relpath(pdf_chords_path, BASE_DIR)
-    db.session.commit()
+    try:
+        build_song_pdfs(song.id, tex_file_absolute, song_folder)
+    except Exception as e:
+        app.logger.exception(f"PDF generation failed for song {song.id}")
+        flash(f"PDF generation failed: {e}", "error")
+        return redirect(url_for('song_view', song_id=song_id))
 
     flash("PDFs generated successfully!", "success")
     return redirect(url_for('song_view', song_id=song_id))
@@ -1201,33 +1534,19 @@ def generate_pdfs(song_id):
 @app.route('/api/category_counts')
 def get_category_counts():
     """API endpoint to get category counts with optional filtering"""
-    from unidecode import unidecode
-    import re
-    
     # Get filter parameters (same as search API)
     query = request.args.get('q', '').strip()
     printed_filter = request.args.get('printed')
     unchecked_filter = request.args.get('unchecked')
     active_categories = request.args.get('active_categories')  # comma-separated active filters
     
-    # List of all categories
-    categories = [
-        "stále omšové spevy", "úvod", "medzispevy (žalmy; aleluja)", "obetovanie",
-        "prijímanie", "poďakovanie po prijímaní", "záver", "adorácia", "advent",
-        "vianoce", "pôst", "veľká noc", "cez rok", "k Duchu Svätému", "mariánske",
-        "k svätcom", "detské", "iné", "liturgia hodín", "sobášne", "Taizé",
-        "krížová cesta", "nevhodné"
-    ]
-    
-    # Build base query with filters (excluding category filters for now)
+    # Build base query with filters
     query_obj = Song.query
     
     # Apply text search if provided
     if query:
-        query_no_chords = re.sub(r'\[[^\]]*\]', '', query)
-        normalized_query = unidecode(query_no_chords.lower()).replace(",", " ").replace(".", " ").replace("-", " ").replace("_", " ").replace(";", " ").strip()
-        normalized_query = re.sub(r'\s+', ' ', normalized_query)
-        query_obj = query_obj.filter(Song.search_text.like(f'%{normalized_query}%'))
+        normalized_query = normalize_search_query(query)
+        query_obj = query_obj.filter(Song.id.in_(select(song_fts.c.rowid).where(song_fts.c.search_text.like(f'%{normalized_query}%'))))
     
     # Apply other filters
     if printed_filter == 'true':
@@ -1235,34 +1554,21 @@ def get_category_counts():
     if unchecked_filter == 'true':
         query_obj = query_obj.filter(Song.admin_checked == False)
     
-    # Get active categories list for intersection logic
-    active_categories_list = []
+    # Active categories apply to every count (intersection logic), so they are plain WHERE filters
     if active_categories:
-        active_categories_list = [cat.strip().lower() for cat in active_categories.split(',') if cat.strip()]
+        for active_cat in [cat.strip().lower() for cat in active_categories.split(',') if cat.strip()]:
+            query_obj = query_obj.filter(Song.categories.ilike(category_pattern(active_cat)))
     
-    # Calculate counts for each category
+    # Count every category in one aggregate query
     category_counts = {}
-    
-    for category in categories:
-        # For each category, create a query that includes this category + all active categories
-        category_query = query_obj
-        
-        # Add the current category we're counting
-        category_query = category_query.filter(Song.categories.ilike(f'%{category.lower()}%'))
-        
-        # Add all active category filters (intersection logic)
-        for active_cat in active_categories_list:
-            if active_cat != category.lower():  # Don't double-filter the same category
-                category_query = category_query.filter(Song.categories.ilike(f'%{active_cat}%'))
-        
-        # Count songs for this category
-        count = category_query.count()
+    counts = count_categories(query_obj)
+    for category, category_lower, _ in CATEGORY_ILIKE_PATTERNS:
         # Use lowercase version as key to match what frontend JavaScript expects
         # (frontend does btn.dataset.category.toLowerCase())  
-        category_counts[category.lower()] = count
+        category_counts[category_lower] = counts[category]
         
         # Also add the original case version for debugging/fallback
-        category_counts[category] = count
+        category_counts[category] = counts[category]
     
     # Ensure JSON response has proper UTF-8 encoding
     return jsonify(category_counts)
@@ -1270,4 +1576,7 @@ def get_category_counts():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_columns(db.engine)
+        create_missing_indexes(db.engine)
+        create_search_index(db.engine)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
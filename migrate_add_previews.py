@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Song Preview Columns Migration Script
+=====================================
+
+This script adds the verse1_preview and chorus_preview columns to the song
+table and fills them for all existing songs, so /api/search can return the
+previews without decoding song_parts for every result row.
+
+New songs and edited songs get their previews from the Song model listeners,
+and `python app.py` adds and fills the columns on startup
+(models.create_missing_columns). This script does the same offline, with a
+backup first.
+
+Affected fields:
+- verse1_preview
+- chorus_preview
+"""
+
+import sqlite3
+import os
+import shutil
+from datetime import datetime
+
+from models import extract_previews, load_song_parts
+
+# Database configuration
+DB_PATH = 'instance/songs.db'
+BACKUP_DIR = 'instance/backups'
+
+PREVIEW_COLUMNS = ['verse1_preview', 'chorus_preview']
+
+def create_backup():
+    """Create a backup of the database before migration"""
+    if not os.path.exists(BACKUP_DIR):
+        os.makedirs(BACKUP_DIR)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_path = os.path.join(BACKUP_DIR, f'songs_backup_before_preview_migration_{timestamp}.db')
+
+    # Copy database file
+    shutil.copy2(DB_PATH, backup_path)
+
+    print(f"✅ Database backup created: {backup_path}")
+    return backup_path
+
+def add_columns(cursor):
+    """Add the preview columns if they are missing"""
+    cursor.execute("PRAGMA table_info(song)")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+
+    for column in PREVIEW_COLUMNS:
+        if column in existing_columns:
+            print(f"   ✅ Column {column} already exists")
+        else:
+            cursor.execute(f"ALTER TABLE song ADD COLUMN {column} VARCHAR(256)")
+            print(f"   ➕ Added column {column}")
+
+def populate_previews(cursor):
+    """Compute the previews for every song"""
+    print("\n🔄 Computing previews...")
+
+    cursor.execute("SELECT id, song_parts FROM song")
+    updates = []
+    for song_pk, song_parts in cursor.fetchall():
+        verse1_preview, chorus_preview = extract_previews(load_song_parts(song_parts))
+        updates.append((verse1_preview, chorus_preview, song_pk))
+
+    cursor.executemany("UPDATE song SET verse1_preview = ?, chorus_preview = ? WHERE id = ?", updates)
+    print(f"✅ Updated previews for {len(updates)} songs")
+    return len(updates)
+
+def main():
+    """Main migration function"""
+    print("📝 Song Preview Migration Script")
+    print("=" * 50)
+
+    # Check if database exists
+    if not os.path.exists(DB_PATH):
+        print(f"❌ Database not found: {DB_PATH}")
+        print("   Make sure you're running this from the novy_spev directory")
+        return
+
+    # Create backup
+    backup_path = create_backup()
+
+    try:
+        # Connect to database
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+
+        print("\n🔍 Checking columns...")
+        add_columns(cursor)
+
+        updated_count = populate_previews(cursor)
+
+        # Commit changes
+        conn.commit()
+        print("💾 Changes committed to database")
+
+        print(f"\n🎉 Migration completed successfully!")
+        print(f"   Updated {updated_count} songs")
+        print(f"   Backup available at: {backup_path}")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        print(f"   Database backup is available at: {backup_path}")
+
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,9 @@ Affected fields:
 
 import sqlite3
 import os
+import re
 import json
+from collections import defaultdict
 from datetime import datetime
 
 # Database configuration
@@ -38,6 +40,8 @@ ABSOLUTE_PATH_PREFIXES = [
     '/app/',
     # Add more absolute prefixes as needed
 ]
+# All prefixes in one pattern, tried in the order listed above
+ABSOLUTE_PATH_PREFIX_RE = re.compile('^(?:' + '|'.join(re.escape(prefix) for prefix in ABSOLUTE_PATH_PREFIXES) + ')')
 
 def create_backup():
     """Create a backup of the database before migration"""
@@ -64,17 +68,17 @@ def migrate_path(original_path):
         return original_path
     
     # Remove known absolute prefixes to make path relative
-    for prefix in ABSOLUTE_PATH_PREFIXES:
-        if original_path.startswith(prefix):
-            relative_path = original_path[len(prefix):]
-            # Ensure it starts with static/ or another expected relative path
-            if relative_path.startswith('static/') or relative_path.startswith('uploads/'):
-                return relative_path
-            # If it's just the filename, prepend static/uploads/
-            elif '/' not in relative_path:
-                return f'static/uploads/{relative_path}'
-            else:
-                return relative_path
+    prefix_match = ABSOLUTE_PATH_PREFIX_RE.match(original_path)
+    if prefix_match:
+        relative_path = original_path[prefix_match.end():]
+        # Ensure it starts with static/ or another expected relative path
+        if relative_path.startswith('static/') or relative_path.startswith('uploads/'):
+            return relative_path
+        # If it's just the filename, prepend static/uploads/
+        elif '/' not in relative_path:
+            return f'static/uploads/{relative_path}'
+        else:
+            return relative_path
     
     # If no known prefix found, try to extract relative part
     # Look for patterns like /*/static/uploads/ or /*/uploads/
@@ -86,58 +90,59 @@ def migrate_path(original_path):
     # If all else fails, return original path (might need manual review)
     return original_path
 
-def analyze_paths(cursor):
+PATH_FIELDS = ['tex_path', 'pdf_lyrics_path', 'pdf_chords_path']
+
+def fetch_path_rows(cursor):
+    """Read id, song_id and all path fields in a single scan of the song table"""
+    cursor.execute(f"SELECT id, song_id, {', '.join(PATH_FIELDS)} FROM song")
+    return cursor.fetchall()
+
+def analyze_paths(rows):
     """Analyze current paths in the database"""
     print("\n📊 Analyzing current paths in database...")
     
-    # Check tex_path
-    cursor.execute("SELECT COUNT(*) FROM song WHERE tex_path IS NOT NULL AND tex_path != ''")
-    tex_count = cursor.fetchone()[0]
+    # Non-empty paths per field (row layout: id, song_id, *PATH_FIELDS)
+    paths_by_field = {
+        field: [row[2 + index] for row in rows if row[2 + index]]
+        for index, field in enumerate(PATH_FIELDS)
+    }
     
-    cursor.execute("SELECT COUNT(*) FROM song WHERE pdf_lyrics_path IS NOT NULL AND pdf_lyrics_path != ''")
-    pdf_lyrics_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM song WHERE pdf_chords_path IS NOT NULL AND pdf_chords_path != ''")
-    pdf_chords_count = cursor.fetchone()[0]
-    
-    print(f"   TeX files: {tex_count} records")
-    print(f"   PDF lyrics files: {pdf_lyrics_count} records") 
-    print(f"   PDF chords files: {pdf_chords_count} records")
+    print(f"   TeX files: {len(paths_by_field['tex_path'])} records")
+    print(f"   PDF lyrics files: {len(paths_by_field['pdf_lyrics_path'])} records") 
+    print(f"   PDF chords files: {len(paths_by_field['pdf_chords_path'])} records")
     
     # Sample paths for each type
     print("\n📁 Sample current paths:")
     
-    cursor.execute("SELECT tex_path FROM song WHERE tex_path IS NOT NULL AND tex_path != '' LIMIT 3")
-    tex_samples = cursor.fetchall()
+    tex_samples = paths_by_field['tex_path'][:3]
     if tex_samples:
         print("   TeX paths:")
-        for (path,) in tex_samples:
+        for path in tex_samples:
             print(f"     {path}")
     
-    cursor.execute("SELECT pdf_lyrics_path FROM song WHERE pdf_lyrics_path IS NOT NULL AND pdf_lyrics_path != '' LIMIT 3") 
-    pdf_samples = cursor.fetchall()
+    pdf_samples = paths_by_field['pdf_lyrics_path'][:3]
     if pdf_samples:
         print("   PDF paths:")
-        for (path,) in pdf_samples:
+        for path in pdf_samples:
             print(f"     {path}")
 
-def preview_migration(cursor):
+def preview_migration(rows):
     """Preview what changes will be made"""
     print("\n🔍 Migration preview:")
     
     changes = []
     
     # Check all path fields
-    for field in ['tex_path', 'pdf_lyrics_path', 'pdf_chords_path']:
-        cursor.execute(f"SELECT id, song_id, {field} FROM song WHERE {field} IS NOT NULL AND {field} != ''")
-        records = cursor.fetchall()
-        
-        for song_id_pk, song_id, original_path in records:
+    for index, field in enumerate(PATH_FIELDS):
+        for row in rows:
+            original_path = row[2 + index]
+            if not original_path:
+                continue
             new_path = migrate_path(original_path)
             if new_path != original_path:
                 changes.append({
-                    'song_id_pk': song_id_pk,
-                    'song_id': song_id, 
+                    'song_id_pk': row[0],
+                    'song_id': row[1], 
                     'field': field,
                     'old_path': original_path,
                     'new_path': new_path
@@ -161,19 +166,16 @@ def perform_migration(cursor, changes):
     """Perform the actual migration"""
     print(f"\n🔄 Starting migration of {len(changes)} paths...")
     
-    updated_count = 0
-    
+    # One executemany per field instead of one statement per changed path
+    by_field = defaultdict(list)
     for change in changes:
-        try:
-            query = f"UPDATE song SET {change['field']} = ? WHERE id = ?"
-            cursor.execute(query, (change['new_path'], change['song_id_pk']))
-            updated_count += 1
-            
-            if updated_count % 10 == 0:
-                print(f"   ✅ Updated {updated_count}/{len(changes)} paths...")
-                
-        except Exception as e:
-            print(f"   ❌ Error updating song {change['song_id']} {change['field']}: {e}")
+        by_field[change['field']].append((change['new_path'], change['song_id_pk']))
+    
+    updated_count = 0
+    for field, rows in by_field.items():
+        cursor.executemany(f"UPDATE song SET {field} = ? WHERE id = ?", rows)
+        updated_count += len(rows)
+        print(f"   ✅ Updated {len(rows)} {field} values")
     
     print(f"✅ Migration completed! Updated {updated_count} paths")
     return updated_count
@@ -186,7 +188,7 @@ def verify_migration(cursor):
     old_path_found = False
     
     for prefix in ABSOLUTE_PATH_PREFIXES:
-        for field in ['tex_path', 'pdf_lyrics_path', 'pdf_chords_path']:
+        for field in PATH_FIELDS:
             cursor.execute(f"SELECT COUNT(*) FROM song WHERE {field} LIKE ?", (f'{prefix}%',))
             count = cursor.fetchone()[0]
             
@@ -222,13 +224,14 @@ def main():
     try:
         # Connect to database
         conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
         cursor = conn.cursor()
         
-        # Analyze current state
-        analyze_paths(cursor)
-        
-        # Preview changes
-        changes = preview_migration(cursor)
+        # Analyze current state and preview changes from one read of the table
+        rows = fetch_path_rows(cursor)
+        analyze_paths(rows)
+        changes = preview_migration(rows)
         
         if not changes:
             print("\n✅ No migration needed - all paths are already relative")
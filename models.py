@@ -2,14 +2,16 @@ from flask_sqlalchemy import SQLAlchemy
 from flask import Flask, render_template, request, send_file, redirect, url_for, current_app
 from flask_sqlalchemy import SQLAlchemy
 import os
-import json
+import orjson
 import subprocess
 from tempfile import mkdtemp
 from shutil import rmtree, copy2
 from sqlalchemy import event
 from pathlib import Path
-from unidecode import unidecode
+from unidecode import unidecode, unidecode_expect_ascii
+import unicodedata
 import re
+from functools import lru_cache
 import os
 from sqlalchemy import UniqueConstraint
 import logging
@@ -18,6 +20,85 @@ logging.basicConfig(level=logging.INFO)
 
 db = SQLAlchemy()
 
+# Chord markers like [C] or [Am7] inside lyrics
+CHORD_RE = re.compile(r'\[[^\]]*\]')
+# Punctuation that separates words in search text
+PUNCTUATION_TO_SPACE = str.maketrans(',.-_;', '     ')
+# ASCII fast path of normalize_text: punctuation to spaces and lowercasing in one translate
+ASCII_SEARCH_TABLE = str.maketrans({
+    **{char: ' ' for char in ',.-_;'},
+    **{chr(code): chr(code + 32) for code in range(ord('A'), ord('Z') + 1)},
+})
+# "^A-\d{3}$"-style patterns per initial letter, compiled on first use
+SONG_ID_PATTERNS = {}
+
+@lru_cache(maxsize=None)
+def _is_accented_ascii_letter(char):
+    """True if char canonically decomposes into an ASCII letter plus combining marks (á, ľ, ô, ...)"""
+    decomposed = unicodedata.normalize('NFD', char)
+    return decomposed[0].isascii() and decomposed[0].isalpha() and all(unicodedata.combining(mark) for mark in decomposed[1:])
+
+def to_ascii(text):
+    """Strip diacritics; NFKD covers plain accented letters, unidecode handles everything else (´, ł, ß, ...)"""
+    if text.isascii():
+        return text
+    if all(_is_accented_ascii_letter(char) for char in text if not char.isascii()):
+        return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return unidecode(text)
+
+def normalize_text(text):
+    """Normalize text for search: no chords, lowercase ASCII, punctuation turned into spaces, single-spaced"""
+    if not text:
+        return ""
+    if text.isascii():
+        # Most lyrics lines: no unidecode needed, one translate does lowercasing and punctuation
+        if '[' in text:
+            text = CHORD_RE.sub('', text)
+        return " ".join(text.translate(ASCII_SEARCH_TABLE).split())
+    # First remove chord brackets [C], [Am], [G7], etc. - replace with empty string to avoid splitting words
+    text_no_chords = CHORD_RE.sub('', text)
+    # Then normalize: remove diacritics, punctuation, normalize whitespace
+    return " ".join(to_ascii(text_no_chords.lower()).translate(PUNCTUATION_TO_SPACE).split())
+
+def load_song_parts(song_parts):
+    """Decode the song_parts JSON; empty list if missing or malformed"""
+    if not song_parts:
+        return []
+    try:
+        return orjson.loads(song_parts) or []
+    except (orjson.JSONDecodeError, TypeError):
+        return []
+
+def iter_search_text_parts(title, version_name, author, title_original, author_original, alternative_titles, song_data):
+    """Yield the normalized pieces of a song's search text, in order (some may be empty)"""
+    # Basic song info
+    yield normalize_text(title)
+    yield normalize_text(version_name)
+    yield normalize_text(author)
+    yield normalize_text(title_original)
+    yield normalize_text(author_original)
+
+    # Alternative titles
+    if alternative_titles:
+        for alt_title in alternative_titles.split(';;'):
+            yield normalize_text(alt_title)
+
+    # Song parts (lyrics)
+    try:
+        for part in song_data:
+            if isinstance(part, dict) and 'lines' in part:
+                for line in part['lines']:
+                    yield normalize_text(line)
+    except TypeError:
+        pass
+
+def build_search_text(title, version_name, author, title_original, author_original, alternative_titles, song_data):
+    """Build the normalized search text for a song from its column values (song_parts decoded)"""
+    # normalize_text output is already single-spaced and stripped, so joining the non-empty pieces is enough
+    return " ".join(part for part in iter_search_text_parts(
+        title, version_name, author, title_original, author_original, alternative_titles, song_data
+    ) if part)
+
 class Song(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     song_id = db.Column(db.String(10), nullable=False)  # Format: A-001
@@ -46,90 +127,157 @@ class Song(db.Model):
     # Add normalized search fields for fast searching
     search_text = db.Column(db.Text, nullable=True)  # Pre-normalized searchable text
 
+    # First words of the first verse/chorus, shown in search results
+    verse1_preview = db.Column(db.String(256), nullable=True)
+    chorus_preview = db.Column(db.String(256), nullable=True)
+
+    # ORDER BY song_id is served by the unique (song_id, version_name) index
     __table_args__ = (
         UniqueConstraint('song_id', 'version_name', name='uix_song_id_version'),
+        db.Index('ix_song_admin_printed', 'admin_checked', 'printed'),
+        # printed/unchecked search filters walk this in song_id order, so LIMIT can stop early
+        db.Index('ix_song_printed_admin_songid', 'printed', 'admin_checked', 'song_id'),
     )
 
+    def song_data(self):
+        """Decoded song_parts; reuses the listeners' _parts_cache so one flush parses it once"""
+        song_data = getattr(self, '_parts_cache', None)
+        if song_data is None:
+            song_data = load_song_parts(self.song_parts)
+        return song_data
+
     def update_search_text(self):
         """Update the normalized search text field"""
-        def normalize_text(text):
-            if not text:
-                return ""
-            # First remove chord brackets [C], [Am], [G7], etc. - replace with empty string to avoid splitting words
-            text_no_chords = re.sub(r'\[[^\]]*\]', '', text)
-            # Then normalize: remove diacritics, punctuation, normalize whitespace
-            return unidecode(text_no_chords.lower()).replace(",", " ").replace(".", " ").replace("-", " ").replace("_", " ").replace(";", " ").strip()
-        
-        # Collect all searchable text
-        parts = []
-        
-        # Basic song info
-        parts.append(normalize_text(self.title or ""))
-        parts.append(normalize_text(self.version_name or ""))
-        parts.append(normalize_text(self.author or ""))
-        parts.append(normalize_text(self.title_original or ""))
-        parts.append(normalize_text(self.author_original or ""))
-        
-        # Alternative titles
-        if self.alternative_titles:
-            alt_titles = self.alternative_titles.split(';;')
-            for alt_title in alt_titles:
-                parts.append(normalize_text(alt_title))
-        
-        # Song parts (lyrics)
-        if self.song_parts:
-            try:
-                song_data = json.loads(self.song_parts)
-                for part in song_data:
-                    if isinstance(part, dict) and 'lines' in part:
-                        for line in part['lines']:
-                            parts.append(normalize_text(line))
-            except (json.JSONDecodeError, TypeError):
-                pass
-        
-        # Join all parts with spaces and normalize whitespace
-        self.search_text = " ".join(filter(None, parts))
-        self.search_text = re.sub(r'\s+', ' ', self.search_text).strip()
-from sqlalchemy import event
+        self.search_text = build_search_text(
+            self.title, self.version_name, self.author, self.title_original,
+            self.author_original, self.alternative_titles, self.song_data()
+        )
+
+    @classmethod
+    def rebuild_all_search_text(cls, session, chunk=1000):
+        """Recompute search_text for every song, e.g. after the normalize_text rules change.
+
+        Reads plain column tuples and writes back with bulk_update_mappings, one
+        executemany UPDATE per chunk. ORM event listeners do NOT fire on this path
+        (song_id, previews and the updated-row history are left alone); the song_fts
+        triggers still keep the search index in sync. The caller commits.
+        """
+        rows = session.query(
+            cls.id, cls.title, cls.version_name, cls.author, cls.title_original,
+            cls.author_original, cls.alternative_titles, cls.song_parts
+        ).yield_per(chunk)
+        mappings = []
+        updated = 0
+        for song_pk, *fields, song_parts in rows:
+            mappings.append({'id': song_pk, 'search_text': build_search_text(*fields, load_song_parts(song_parts))})
+            if len(mappings) >= chunk:
+                session.bulk_update_mappings(cls, mappings)
+                updated += len(mappings)
+                mappings = []
+        if mappings:
+            session.bulk_update_mappings(cls, mappings)
+            updated += len(mappings)
+        return updated
+
+    @classmethod
+    def bulk_create(cls, session, rows):
+        """Insert many songs (dicts of column values) with one bulk_insert_mappings call.
+
+        song_id, search_text and the previews are computed here, with existing song_ids
+        read once and grouped by letter. ORM events are skipped on purpose: nothing else
+        listening on Song insert runs, so callers drop their own caches. The song_fts
+        triggers still index the new rows. The caller commits.
+        """
+        used_numbers = {}
+        for (sid,) in session.query(cls.song_id):
+            if sid and song_id_pattern(sid[0]).match(sid):
+                used_numbers.setdefault(sid[0], set()).add(int(sid[2:]))
+
+        for row in rows:
+            letter = song_id_letter(row['title'])
+            letter_numbers = used_numbers.setdefault(letter, set())
+            new_number = first_free_number(letter_numbers)
+            letter_numbers.add(new_number)
+            row['song_id'] = f"{letter}-{new_number:03d}"
+
+            song_data = load_song_parts(row.get('song_parts'))
+            row['search_text'] = build_search_text(
+                row.get('title'), row.get('version_name'), row.get('author'), row.get('title_original'),
+                row.get('author_original'), row.get('alternative_titles'), song_data
+            )
+            row['verse1_preview'], row['chorus_preview'] = extract_previews(song_data)
+
+        session.bulk_insert_mappings(cls, rows)
+        return rows
+
+    def update_previews(self):
+        """Update the verse/chorus preview fields from song_parts"""
+        self.verse1_preview, self.chorus_preview = extract_previews(self.song_data())
+from sqlalchemy import event, table, column
 from sqlalchemy.orm import Session
-import json
+
+VERSE_PART_TYPES = ('sloka', 'verse', 'verse1', 'verš')
+CHORUS_PART_TYPES = ('refren', 'chorus', 'refrén')
+
+def extract_previews(song_data):
+    """Return the first 9 words (chords stripped) of the first verse and the first chorus"""
+    verse1_preview = ""
+    chorus_preview = ""
+    for part in song_data:
+        if not isinstance(part, dict):
+            continue
+        part_type = part.get('type', '').lower()
+        lines = part.get('lines', [])
+        if not lines:
+            continue
+
+        if part_type in VERSE_PART_TYPES and not verse1_preview:
+            verse1_preview = ' '.join(CHORD_RE.sub('', lines[0]).split()[:9])
+        elif part_type in CHORUS_PART_TYPES and not chorus_preview:
+            chorus_preview = ' '.join(CHORD_RE.sub('', lines[0]).split()[:9])
+    return verse1_preview, chorus_preview
+
+def song_id_letter(title):
+    """Initial letter of a title's song_id (Ábel -> A)"""
+    normalized_title = unidecode_expect_ascii(title).strip()
+    if not normalized_title:
+        logging.error("Missing title, cannot generate song_id")
+        raise ValueError(f"Title {title} is required to generate song_id")
+    return normalized_title[0].upper()
+
+def song_id_pattern(letter):
+    """Compiled "^A-\\d{3}$"-style pattern for well-formed song_ids of a letter"""
+    pattern = SONG_ID_PATTERNS.get(letter)
+    if pattern is None:
+        pattern = SONG_ID_PATTERNS[letter] = re.compile(f"^{re.escape(letter)}-\\d{{3}}$")
+    return pattern
+
+def first_free_number(used_numbers):
+    """Smallest positive number not in the set (some number up to len + 1 is always free)"""
+    return next(number for number in range(1, len(used_numbers) + 2) if number not in used_numbers)
 
 def generate_song_id(mapper, connection, target):
     session = Session.object_session(target)
     with session.no_autoflush:
-        normalized_title = unidecode(target.title).strip()
-        if not normalized_title:
-            logging.error("Missing title, cannot generate song_id")
-            raise ValueError(f"Title {target.title} is required to generate song_id")
-
-        letter = normalized_title[0].upper()
-        # logger.debug(f"Normalized title: {normalized_title}, initial letter: {letter}")
+        letter = song_id_letter(target.title)
+        # logger.debug(f"Initial letter: {letter}")
 
-        # Get all existing song_ids from DB
-        all_ids = session.query(Song.song_id).all()
-        # logger.debug(f"All song_ids from DB: {all_ids}")
+        # Get the song_ids starting with "<letter>-" from DB; a range ('-' < '.') is an index
+        # range scan on (song_id, version_name), where LIKE 'X-%' would scan the whole index
+        letter_ids = session.query(Song.song_id).filter(
+            Song.song_id >= f"{letter}-", Song.song_id < f"{letter}."
+        ).all()
+        # logger.debug(f"Song ids for letter {letter}: {letter_ids}")
 
-        pattern = re.compile(f"^{re.escape(letter)}-\\d{{3}}$")
+        pattern = song_id_pattern(letter)
         # logger.debug(f"Regex pattern: {pattern.pattern}")
 
-        # Filter and parse IDs that match the pattern
-        existing_ids = [sid[0] for sid in all_ids if sid[0] and pattern.match(sid[0])]
-        # logger.info(f"Existing IDs for letter {letter}: {existing_ids}")
-
-        used_numbers = sorted([
-            int(match.group(1))
-            for sid in existing_ids
-            if (match := re.search(r'-(\d{3})$', sid))
-        ])
+        # Keep well-formed IDs; the pattern guarantees the number is sid[2:]
+        used_numbers = {int(sid[2:]) for (sid,) in letter_ids if pattern.match(sid)}
         # logger.info(f"Used numbers for {letter}: {used_numbers}")
 
         # Find first available number
-        new_number = 1
-        for num in sorted(set(used_numbers)):  # remove duplicates
-            if num == new_number:
-                new_number += 1
-            else:
-                break
+        new_number = first_free_number(used_numbers)
 
         target.song_id = f"{letter}-{new_number:03d}"
         # logger.info(f"Assigned song_id: {target.song_id}")
@@ -143,20 +291,110 @@ def handle_song_update(mapper, connection, target):
         new_title = target.title
 
         # Normalize and compare initial letters
-        old_initial = unidecode(old_title.strip())[0].upper() if old_title else ''
-        new_initial = unidecode(new_title.strip())[0].upper() if new_title else ''
+        old_initial = unidecode_expect_ascii(old_title.strip())[0].upper() if old_title else ''
+        new_initial = unidecode_expect_ascii(new_title.strip())[0].upper() if new_title else ''
 
         # Only regenerate if initial letter changed
         if old_initial != new_initial:
             generate_song_id(mapper, connection, target)
         # If letter stayed the same but title changed, keep existing song_id
 
+def create_missing_columns(engine):
+    """db.create_all() never alters an existing table: add new nullable Song columns to it,
+    filling the previews for existing songs when those columns are added"""
+    with engine.begin() as conn:
+        existing_columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(song)")}
+        if not existing_columns:
+            return
+        added = []
+        for column in Song.__table__.columns:
+            if column.name not in existing_columns and column.nullable:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE song ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+                )
+                added.append(column.name)
+        if added:
+            logging.info(f"Added song columns: {', '.join(added)}")
+        if 'verse1_preview' in added or 'chorus_preview' in added:
+            rows = conn.exec_driver_sql("SELECT id, song_parts FROM song").all()
+            conn.exec_driver_sql(
+                "UPDATE song SET verse1_preview = ?, chorus_preview = ? WHERE id = ?",
+                [(*extract_previews(load_song_parts(song_parts)), song_pk) for song_pk, song_parts in rows]
+            )
+
+def create_missing_indexes(engine):
+    """db.create_all() only adds indexes along with new tables; create any missing ones on an existing database"""
+    for index in Song.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+# FTS5 trigram index over song.search_text: LIKE '%...%' on song_fts is answered from
+# the index instead of scanning every row. Kept in sync with song by triggers.
+song_fts = table('song_fts', column('rowid'), column('search_text'))
+
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS song_fts USING fts5(
+        search_text, content='song', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS song_fts_ai AFTER INSERT ON song BEGIN
+        INSERT INTO song_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS song_fts_ad AFTER DELETE ON song BEGIN
+        INSERT INTO song_fts(song_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS song_fts_au AFTER UPDATE OF search_text ON song BEGIN
+        INSERT INTO song_fts(song_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO song_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+]
+
+def create_search_index(engine):
+    """Create the song_fts table and its triggers, indexing existing songs the first time"""
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'song_fts'"
+        ).first()
+        for statement in SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO song_fts(song_fts) VALUES ('rebuild')")
+
+def create_search_index_with_table(target, connection, **kw):
+    """db.create_all() on a fresh database creates song_fts and its triggers right after song"""
+    if connection.dialect.name == 'sqlite':
+        for statement in SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(statement)
+
+# Columns that feed Song.search_text (song_parts also feeds the previews)
+SEARCH_TEXT_FIELDS = ('title', 'version_name', 'author', 'title_original', 'author_original', 'alternative_titles', 'song_parts')
+
 def update_search_text_listener(mapper, connection, target):
-    """Update search text before inserting or updating"""
-    target.update_search_text()
+    """Update search text and previews before inserting"""
+    # Parse song_parts once for both; dropped afterwards so a later edit is never served stale
+    target._parts_cache = load_song_parts(target.song_parts)
+    try:
+        target.update_search_text()
+        target.update_previews()
+    finally:
+        del target._parts_cache
+
+def update_changed_search_text_listener(mapper, connection, target):
+    """Before updating, rebuild search text / previews only if the columns they are built from changed"""
+    attrs = db.inspect(target).attrs
+    search_text_changed = any(attrs[field].history.has_changes() for field in SEARCH_TEXT_FIELDS)
+    song_parts_changed = attrs.song_parts.history.has_changes()
+    if not search_text_changed:
+        return
+    target._parts_cache = load_song_parts(target.song_parts)
+    try:
+        target.update_search_text()
+        if song_parts_changed:
+            target.update_previews()
+    finally:
+        del target._parts_cache
 
 event.listen(Song, 'before_insert', generate_song_id)
 event.listen(Song, 'before_update', handle_song_update)
 event.listen(Song, 'before_insert', update_search_text_listener)
-event.listen(Song, 'before_update', update_search_text_listener)
+event.listen(Song, 'before_update', update_changed_search_text_listener)
+event.listen(Song.__table__, 'after_create', create_search_index_with_table)
 
@@ -1,6 +1,7 @@
+import io
+import logging
 import os
-import tempfile
-from PyPDF2 import PdfReader, PdfWriter
+from pypdf import PdfReader, PdfWriter
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
@@ -8,61 +9,130 @@ from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+log = logging.getLogger(__name__)
+
+# Stamp geometry and colours (mimicking the TikZ style): a box ~35mm x 18mm in points
+_BOX_W, _BOX_H = 100, 50
+_BOX_FILL = colors.Color(0.68, 0.85, 0.9, alpha=0.5)
+_STROKE = colors.lightblue  # gray!60
+_TEXT_GRAY = (0.7, 0.7, 0.7)  # gray!70
+
+# font_path -> True once the fonts from it are registered; ReportLab keeps registered fonts per process.
+# Failures are not cached, so fonts added later are picked up on the next call
+_FONTS_REGISTERED = {}
+
 # Register the Poppins font family
 def register_poppins_fonts(font_path="/home/Davos/novy_spev/static/fonts/"):
     """
-    Register all variants of the Poppins font with ReportLab
+    Register all variants of the Poppins font with ReportLab (once per process and font_path)
     """
-    print(f"[FONT DEBUG] register_poppins_fonts called with font_path: {font_path}")
+    if _FONTS_REGISTERED.get(font_path):
+        return True
+
+    log.debug("register_poppins_fonts called with font_path: %s", font_path)
     try:
-        print(f"[FONT DEBUG] Absolute font path: {font_path}")
+        log.debug("Absolute font path: %s", font_path)
 
 
         # Register regular font
         poppins_regular = os.path.join(font_path, "Poppins-Regular.ttf")
-        print(f"[FONT DEBUG] Looking for Poppins-Regular.ttf at: {poppins_regular}")
+        log.debug("Looking for Poppins-Regular.ttf at: %s", poppins_regular)
         if os.path.exists(poppins_regular):
             pdfmetrics.registerFont(TTFont("Poppins", poppins_regular))
-            print(f"[FONT DEBUG] Registered Poppins-Regular.ttf")
+            log.debug("Registered Poppins-Regular.ttf")
         else:
-            print(f"[FONT DEBUG] Poppins-Regular.ttf not found")
+            log.debug("Poppins-Regular.ttf not found")
 
         # Register bold font
         poppins_bold = os.path.join(font_path, "Poppins-Bold.ttf")
-        print(f"[FONT DEBUG] Looking for Poppins-Bold.ttf at: {poppins_bold}")
+        log.debug("Looking for Poppins-Bold.ttf at: %s", poppins_bold)
         if os.path.exists(poppins_bold):
             pdfmetrics.registerFont(TTFont("Poppins-Bold", poppins_bold))
-            print(f"[FONT DEBUG] Registered Poppins-Bold.ttf")
+            log.debug("Registered Poppins-Bold.ttf")
         else:
-            print(f"[FONT DEBUG] Poppins-Bold.ttf not found")
+            log.debug("Poppins-Bold.ttf not found")
 
         # Register italic font (if available)
         poppins_italic = os.path.join(font_path, "Poppins-Italic.ttf")
-        print(f"[FONT DEBUG] Looking for Poppins-Italic.ttf at: {poppins_italic}")
+        log.debug("Looking for Poppins-Italic.ttf at: %s", poppins_italic)
         if os.path.exists(poppins_italic):
             pdfmetrics.registerFont(TTFont("Poppins-Italic", poppins_italic))
-            print(f"[FONT DEBUG] Registered Poppins-Italic.ttf")
+            log.debug("Registered Poppins-Italic.ttf")
         else:
-            print(f"[FONT DEBUG] Poppins-Italic.ttf not found")
+            log.debug("Poppins-Italic.ttf not found")
 
         # Check if at least regular and bold are available
         fonts_available = os.path.exists(poppins_regular) and os.path.exists(poppins_bold)
-        print(f"[FONT DEBUG] Fonts available: {fonts_available}")
+        log.debug("Fonts available: %s", fonts_available)
+        if fonts_available:
+            _FONTS_REGISTERED[font_path] = True
         return fonts_available
     except Exception as e:
-        print(f"[FONT DEBUG] Error registering fonts: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error registering fonts: %s", e)
         # Fall back to standard fonts
         return False
 
+def _draw_stamp(c, page_width, page_height, song_id, version_name, fonts_available):
+    """Draw the song ID stamp in the top-right corner of the canvas' current page"""
+    log.debug("Drawing stamp for page size %s x %s", page_width, page_height)
+    # Set up coordinates for top-right corner (15pt from right, 20pt from top)
+    # Convert points to PDF units (1 point = 1/72 inch)
+    x_pos = page_width - 15  # 15pt from right edge
+    y_pos = page_height - 20  # 20pt from top edge
+    log.debug("Stamp position: (%s, %s)", x_pos, y_pos)
+
+    # Draw the box (mimicking your TikZ style)
+    c.setStrokeColor(_STROKE)
+    c.setFillColor(_BOX_FILL)
+    c.setLineWidth(2)  # thick
+    c.setDash(6, 3)    # dashed
+
+    # Set fill and draw the rounded rectangle (approximation)
+    c.roundRect(x_pos - _BOX_W, y_pos - _BOX_H,
+                _BOX_W, _BOX_H, 8, stroke=1, fill=1)
+
+    # Add song ID text with custom font if available
+    if fonts_available:
+        c.setFont("Poppins-Bold", 28)
+        log.debug("Using Poppins-Bold font")
+    else:
+        c.setFont("Helvetica-Bold", 28)  # Fallback font
+        log.debug("Using Helvetica-Bold fallback font")
+
+    c.setFillColor(colors.black)  # black
+    c.drawCentredString(x_pos - _BOX_W/2, y_pos - _BOX_H/2 - 5, str(song_id))
+    log.debug("Drew song ID: %s", song_id)
+
+    # Add version name if provided
+    if version_name:
+        if fonts_available:
+            c.setFont("Poppins", 12)
+        else:
+            c.setFont("Helvetica", 12)
+
+        c.setFillColorRGB(*_TEXT_GRAY)
+        c.drawCentredString(x_pos - _BOX_W/2, y_pos - _BOX_H/2 - 20, version_name)
+        log.debug("Drew version name: %s", version_name)
+
+def _build_stamps(page_sizes, song_id, version_name, fonts_available):
+    """Render one stamp page per (width, height) into a single overlay PDF; returns its bytes"""
+    stamp_buffer = io.BytesIO()
+    c = canvas.Canvas(stamp_buffer)
+    for page_width, page_height in page_sizes:
+        c.setPageSize((page_width, page_height))
+        _draw_stamp(c, page_width, page_height, song_id, version_name, fonts_available)
+        c.showPage()
+    c.save()
+    return stamp_buffer.getvalue()
+
 def stamp_pdf(input_pdf_path, output_pdf_path, song_id, version_name=None, font_path=""):
     """
     Stamp a PDF with song ID and optional version name
     
     Args:
         input_pdf_path: Path to the input PDF file
-        output_pdf_path: Path where stamped PDF will be saved
+        output_pdf_path: Path where stamped PDF will be saved, or a writable binary
+                         file-like object (e.g. io.BytesIO) to write it into
         song_id: Song ID to display in the stamp
         version_name: Optional version name to display
         font_path: Path to directory containing Poppins fonts
@@ -70,120 +140,70 @@ def stamp_pdf(input_pdf_path, output_pdf_path, song_id, version_name=None, font_
     Returns:
         bool: True if successful, False otherwise
     """
-    print(f"[STAMPER DEBUG] stamp_pdf called with:")
-    print(f"  input_pdf_path: {input_pdf_path}")
-    print(f"  output_pdf_path: {output_pdf_path}")
-    print(f"  song_id: {song_id}")
-    print(f"  version_name: {version_name}")
-    print(f"  font_path: {font_path}")
+    log.debug("stamp_pdf called with input_pdf_path=%s, output_pdf_path=%s, song_id=%s, version_name=%s, font_path=%s",
+              input_pdf_path, output_pdf_path, song_id, version_name, font_path)
     
     try:
         # Register custom fonts
         fonts_available = register_poppins_fonts(font_path)
-        print(f"[STAMPER DEBUG] Fonts available: {fonts_available}")
+        log.debug("Fonts available: %s", fonts_available)
 
         # Read the input PDF first to get page dimensions
-        print(f"[STAMPER DEBUG] Reading input PDF to get page dimensions...")
+        log.debug("Reading input PDF to get page dimensions...")
         reader = PdfReader(input_pdf_path)
-        print(f"[STAMPER DEBUG] Input PDF has {len(reader.pages)} pages")
-
-        writer = PdfWriter()
+        log.debug("Input PDF has %d pages", len(reader.pages))
 
+        # Page sizes in page order; the stamp only depends on the size, so it is built once per size
+        page_sizes = []
+        distinct_sizes = {}
         for i, page in enumerate(reader.pages):
-            print(f"[STAMPER DEBUG] Processing page {i+1}")
-
             # Get page dimensions
             media_box = page.mediabox
             page_width = float(media_box.width)
             page_height = float(media_box.height)
-            print(f"[STAMPER DEBUG] Page {i+1} dimensions: {page_width} x {page_height}")
-
-            # Determine if page is landscape (width > height)
-            is_landscape = page_width > page_height
-            print(f"[STAMPER DEBUG] Page {i+1} is landscape: {is_landscape}")
-
-            # Create a temporary file for the stamp for this page
-            temp_stamp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-
-            # Create the stamp with ReportLab using the actual page dimensions
-            if is_landscape:
-                c = canvas.Canvas(temp_stamp.name, pagesize=(page_width, page_height))
-            else:
-                c = canvas.Canvas(temp_stamp.name, pagesize=(page_width, page_height))
-
-            # Set up coordinates for top-right corner (15pt from right, 20pt from top)
-            # Convert points to PDF units (1 point = 1/72 inch)
-            x_pos = page_width - 15  # 15pt from right edge
-            y_pos = page_height - 20  # 20pt from top edge
-            print(f"[STAMPER DEBUG] Stamp position: ({x_pos}, {y_pos})")
-
-            # Draw the box (mimicking your TikZ style)
-            c.setStrokeColor(colors.lightblue)  # gray!60
-            c.setFillColor(colors.Color(0.68, 0.85, 0.9, alpha=0.5))
-            c.setLineWidth(2)  # thick
-            c.setDash(6, 3)    # dashed
-
-            # Draw rounded rectangle (approximation)
-            box_width = 100  # Approx 35mm in points
-            box_height = 50  # Approx 18mm in points
-            print(f"[STAMPER DEBUG] Drawing box: {box_width} x {box_height}")
-
-            # Set fill and draw the rounded rectangle
-            c.roundRect(x_pos - box_width, y_pos - box_height,
-                        box_width, box_height, 8, stroke=1, fill=1)
-
-            # Add song ID text with custom font if available
-            if fonts_available:
-                c.setFont("Poppins-Bold", 28)
-                print(f"[STAMPER DEBUG] Using Poppins-Bold font")
-            else:
-                c.setFont("Helvetica-Bold", 28)  # Fallback font
-                print(f"[STAMPER DEBUG] Using Helvetica-Bold fallback font")
-
-            c.setFillColor(colors.black)  # black
-            c.drawCentredString(x_pos - box_width/2, y_pos - box_height/2 - 5, str(song_id))
-            print(f"[STAMPER DEBUG] Drew song ID: {song_id}")
-
-            # Add version name if provided
-            if version_name:
-                if fonts_available:
-                    c.setFont("Poppins", 12)
-                else:
-                    c.setFont("Helvetica", 12)
-
-                c.setFillColorRGB(0.7, 0.7, 0.7)  # gray!70
-                c.drawCentredString(x_pos - box_width/2, y_pos - box_height/2 - 20, version_name)
-                print(f"[STAMPER DEBUG] Drew version name: {version_name}")
-
-            c.save()
-
-            # Stamp this page
-            stamp_reader = PdfReader(temp_stamp.name)
-            stamp_page = stamp_reader.pages[0]
-            page.merge_page(stamp_page)
-            writer.add_page(page)
-
-            # Clean up temp file for this page
-            os.unlink(temp_stamp.name)
+            log.debug("Page %d dimensions: %s x %s", i + 1, page_width, page_height)
+
+            stamp_key = (round(page_width, 2), round(page_height, 2))
+            page_sizes.append(stamp_key)
+            distinct_sizes.setdefault(stamp_key, (page_width, page_height))
+
+        # One overlay PDF with a page per distinct size, parsed once
+        overlay = PdfReader(io.BytesIO(_build_stamps(distinct_sizes.values(), song_id, version_name, fonts_available)))
+        stamp_pages = dict(zip(distinct_sizes, overlay.pages))
+
+        writer = PdfWriter()
+        if len(stamp_pages) == 1:
+            # Common case: every page has the same size, so one overlay goes on all of them
+            (stamp_page,) = stamp_pages.values()
+            for page in reader.pages:
+                page.merge_page(stamp_page)
+                writer.add_page(page)
+        else:
+            for page, stamp_key in zip(reader.pages, page_sizes):
+                # Stamp this page
+                page.merge_page(stamp_pages[stamp_key])
+                writer.add_page(page)
 
         # Write output
-        print(f"[STAMPER DEBUG] Writing output to: {output_pdf_path}")
+        log.debug("Writing output to: %s", output_pdf_path)
+        if hasattr(output_pdf_path, 'write'):
+            writer.write(output_pdf_path)
+            return True
+
         with open(output_pdf_path, "wb") as output_file:
             writer.write(output_file)
 
         # Verify output file was created
         if os.path.exists(output_pdf_path):
             file_size = os.path.getsize(output_pdf_path)
-            print(f"[STAMPER DEBUG] Output file created successfully, size: {file_size} bytes")
+            log.debug("Output file created successfully, size: %s bytes", file_size)
             return True
         else:
-            print(f"[STAMPER DEBUG] ERROR: Output file was not created")
+            log.error("Output file was not created")
             return False
 
     except Exception as e:
-        print(f"[STAMPER DEBUG] Exception in stamp_pdf: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Exception in stamp_pdf: %s", e)
         return False
 
 # Example usage (only run if script is executed directly)
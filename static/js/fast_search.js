@@ -120,13 +120,14 @@ document.addEventListener("DOMContentLoaded", function () {
     const tableRows = document.querySelectorAll("tbody tr.song-row");
     const mobileCards = document.querySelectorAll(".mobile-song-card.song-row");
     const counts = {};
+    // Lowercase the button categories once instead of once per song
+    const buttonCategories = Array.from(categoryButtons, btn => btn.dataset.category.toLowerCase());
     
     // Count only visible songs in each category when filters are active
     [...tableRows, ...mobileCards].forEach(element => {
       if (element.style.display !== 'none') {
         const categories = (element.dataset.categories || '').toLowerCase();
-        categoryButtons.forEach(btn => {
-          const category = btn.dataset.category.toLowerCase();
+        buttonCategories.forEach(category => {
           if (categories.includes(category)) {
             counts[category] = (counts[category] || 0) + 1;
           }
@@ -168,7 +169,7 @@ document.addEventListener("DOMContentLoaded", function () {
       return;
     }
     
-    const categoryFilters = Array.from(activeFilters);
+    const categoryFilters = Array.from(activeFilters, f => f.toLowerCase());
     const statusFilters = Array.from(activeStatusFilters);
     
     // Filter table rows
@@ -178,7 +179,7 @@ document.addEventListener("DOMContentLoaded", function () {
       // Check category filters (must have ALL selected categories)
       if (categoryFilters.length > 0) {
         const categories = (row.dataset.categories || '').toLowerCase();
-        show = categoryFilters.every(f => categories.includes(f.toLowerCase()));
+        show = categoryFilters.every(f => categories.includes(f));
       }
       
       // Check status filters (must match ALL selected statuses)
@@ -202,7 +203,7 @@ document.addEventListener("DOMContentLoaded", function () {
       // Check category filters (must have ALL selected categories)
       if (categoryFilters.length > 0) {
         const categories = (card.dataset.categories || '').toLowerCase();
-        show = categoryFilters.every(f => categories.includes(f.toLowerCase()));
+        show = categoryFilters.every(f => categories.includes(f));
       }
       
       // Check status filters (must match ALL selected statuses)